@@ -13,26 +13,42 @@ except ImportError:
     py3 = True
 
 import base64
+import os
 from time import time
 from tkinter import PhotoImage, messagebox
 
 from loglan_db import app_lod
 
 from app import dbc_support, is_db_connected
+from app.worker import ConversionWorker, PROGRESS, DONE, CANCELLED
 from config.postgres.models import all_models_pg
+from config.sqlite import SQLITE_FILE_PATH
 from config.text import IMPORT_DIRECTORY_PATH_REMOTE, \
     IMPORT_DIRECTORY_PATH_LOCAL, EXPORT_DIRECTORY_PATH_LOCAL
-from config.text.functions import download_file
+from config.text.functions import download_file, download_files
 from converters.ac_to_pg import convert_ac_to_pg
 from converters.ac_to_txt import convert_ac_to_txt
 from converters.pg_to_ac import convert_pg_to_ac
 from converters.pg_to_txt import convert_pg_to_txt
 from converters.txt_to_ac import convert_txt_to_ac
 from converters.txt_to_pg import convert_txt_to_pg
+from converters.txt_to_sqlite import convert_txt_to_sqlite
 
 popup_message_title = 'Loglan Converter'
 msg_success_export = 'Export completed successfully!'
 msg_success = (popup_message_title, msg_success_export)
+msg_conversion_running = 'Another conversion is running. Please wait until it is finished.'
+msg_conversion_cancelled = 'Conversion cancelled.'
+msg_conversion_incomplete = 'Conversion cancelled. The destination database is left incomplete! ' \
+                            'Run the conversion again to restore it ' \
+                            '(txt → db import continues from the last completed stage).'
+msg_confirm_cancel = 'The existing data of the destination database is already removed. ' \
+                     'If the conversion is cancelled now, the database will be left incomplete. ' \
+                     'Cancel anyway?'
+
+# Milliseconds between polls of the conversion worker
+poll_interval = 200
+worker = ConversionWorker()
 
 
 def app_context():
@@ -54,6 +70,8 @@ def app_context():
 def convert_with_context(function):
     """
     Context decorator for Windows GUI app
+    The context is created here and passed to the function,
+    which pushes it in the worker thread of the conversion
     :param function:
     :return:
     """
@@ -64,13 +82,71 @@ def convert_with_context(function):
             messagebox.showwarning(popup_message_title, err)
             return
 
-        context.push()
-        function(*args, **kwargs)
-        context.pop()
+        function(*args, context=context, **kwargs)
 
     return wrapper
 
 
+def start_conversion(function, message: str, *args, context=None, **kwargs):
+    """
+    Runs the conversion in the background worker and watches its progress
+    Only one conversion may run at a time
+    :param function: Conversion function
+    :param message: Message shown after successful conversion
+    :param context: Flask app context for conversions using the database
+    :return:
+    """
+    if not worker.start(function, *args, context=context, **kwargs):
+        messagebox.showwarning(popup_message_title, msg_conversion_running)
+        return
+
+    states = dbc_support.w.lock_conversion_buttons()
+    dbc_support.status.set("Conversion started...")
+    dbc_support.root.after(poll_interval, watch_conversion, message, states)
+
+
+def watch_conversion(message: str, states: dict):
+    """
+    Shows messages of the background worker, polled by Tk main loop
+    :param message: Message shown after successful conversion
+    :param states: Buttons' states before the conversion
+    :return:
+    """
+    for kind, value in worker.poll():
+        if kind == PROGRESS:
+            dbc_support.status.set(str(value))
+            continue
+
+        dbc_support.w.unlock_conversion_buttons(states)
+        if kind == DONE:
+            dbc_support.status.set("Ready")
+            messagebox.showinfo(popup_message_title, message)
+        elif kind == CANCELLED:
+            dbc_support.status.set("Cancelled")
+            messagebox.showwarning(
+                popup_message_title, msg_conversion_incomplete if value else msg_conversion_cancelled)
+        else:
+            dbc_support.status.set("Failed")
+            messagebox.showerror(popup_message_title, f"Conversion failed: {value}")
+        return
+
+    dbc_support.root.after(poll_interval, watch_conversion, message, states)
+
+
+def cancel_conversion():
+    """
+    Asks the running conversion to stop
+    A destructive conversion is cancelled only after confirmation
+    :return:
+    """
+    if not worker.busy:
+        return
+    if worker.destructive and not messagebox.askyesno(popup_message_title, msg_confirm_cancel):
+        return
+    dbc_support.status.set("Cancelling...")
+    worker.cancel()
+
+
 def get_import_path():
     """
     Gets Import Path value from Windows app field
@@ -96,8 +172,7 @@ def button_convert_ac_to_txt():
     :return:
     """
     destination = get_export_path()
-    convert_ac_to_txt(output_directory=destination)
-    messagebox.showinfo(*msg_success)
+    start_conversion(convert_ac_to_txt, msg_success_export, output_directory=destination)
 
 
 def button_convert_txt_to_ac():
@@ -106,54 +181,68 @@ def button_convert_txt_to_ac():
     :return:
     """
     source = get_import_path()
-    convert_txt_to_ac(source_directory=source)
-    messagebox.showinfo(
-        popup_message_title,
-        f'Export completed successfully from {source}!')
+    start_conversion(
+        convert_txt_to_ac, f'Export completed successfully from {source}!',
+        source_directory=source)
 
 
 @convert_with_context
-def button_convert_txt_to_pg():
+def button_convert_txt_to_pg(context=None):
     """
     Runs conversion assigned to button
+    The import is resumable, so a cancelled or failed one
+    continues from the last completed stage next time
     :return:
     """
     source = get_import_path()
-    convert_txt_to_pg(source_directory=source)
-    messagebox.showinfo(
-        popup_message_title,
-        f'Export completed successfully from {source}!')
+    start_conversion(
+        convert_txt_to_pg, f'Export completed successfully from {source}!',
+        context=context, source_directory=source, resume=True)
+
+
+def button_convert_txt_to_sqlite():
+    """
+    Runs conversion assigned to button
+    The file is created in Export to directory, if it is defined
+    :return:
+    """
+    source = get_import_path()
+    export_path = dbc_support.export_path.get()
+    db_path = os.path.join(export_path, os.path.basename(SQLITE_FILE_PATH)) \
+        if export_path else SQLITE_FILE_PATH
+    start_conversion(
+        convert_txt_to_sqlite, f'SQLite file {db_path} created successfully from {source}!',
+        db_path=db_path, source_directory=source)
 
 
 @convert_with_context
-def button_convert_ac_to_pg():
+def button_convert_ac_to_pg(context=None):
     """
     Runs conversion assigned to button
     :return:
     """
-    convert_ac_to_pg()
-    messagebox.showinfo(*msg_success)
+    start_conversion(convert_ac_to_pg, msg_success_export, context=context)
 
 
 @convert_with_context
-def button_convert_pg_to_ac():
+def button_convert_pg_to_ac(context=None):
     """
     Runs conversion assigned to button
     :return:
     """
-    convert_pg_to_ac()
-    messagebox.showinfo(*msg_success)
+    start_conversion(convert_pg_to_ac, msg_success_export, context=context)
 
 
 @convert_with_context
-def button_convert_pg_to_txt():
+def button_convert_pg_to_txt(context=None):
     """
     Runs conversion assigned to button
     :return:
     """
     destination = get_export_path()
-    convert_pg_to_txt(output_directory=destination)
-    messagebox.showinfo(*msg_success)
+    start_conversion(
+        convert_pg_to_txt, msg_success_export,
+        context=context, output_directory=destination)
 
 
 def download_txt_to_import():
@@ -170,8 +259,7 @@ def download_txt_to_import():
         f"{IMPORT_DIRECTORY_PATH_REMOTE}{model.file_name}" for
         model in all_models_pg if model.file_name]
 
-    for file in files:
-        download_file(file, import_path)
+    download_files(files, import_path)
 
 
 def download_mdb_filled():
@@ -237,6 +325,10 @@ def vp_start_gui():
         :param event:
         :return:
         """
+        if worker.busy:
+            # The button is disabled, but its binding is still triggered
+            return
+
         uri = dbc_support.postgres_uri.get()
 
         if not uri:
@@ -295,7 +387,7 @@ class MainWindow:
         font9 = "-family {Segoe UI} -size 9"
         pg_buttons_default_state = "disable"
 
-        top.geometry("584x348+1259+518")
+        top.geometry("584x388+1259+518")
         top.minsize(120, 1)
         top.maxsize(3460, 1181)
         top.resizable(1, 1)
@@ -469,39 +561,80 @@ class MainWindow:
         self.BTC.configure(text='''Connect''')
 
         self.BTP = tk.Button(top, command=button_convert_txt_to_pg)
-        self.BTP.place(relx=0.839, rely=0.851, height=35, width=80)
+        self.BTP.place(relx=0.711, rely=0.851, height=35, width=78)
         self.BTP.configure(**default_button_configuration)
         self.BTP.configure(text='''text to db''')
         self.BTP.configure(state=pg_buttons_default_state)
 
         self.BTA = tk.Button(top, command=button_convert_txt_to_ac)
-        self.BTA.place(relx=0.017, rely=0.851, height=35, width=90)
+        self.BTA.place(relx=0.017, rely=0.851, height=35, width=78)
         self.BTA.configure(**default_button_configuration)
         self.BTA.configure(text='''text to access''')
 
         self.BAP = tk.Button(top, command=button_convert_ac_to_pg)
-        self.BAP.place(relx=0.36, rely=0.851, height=35, width=90)
+        self.BAP.place(relx=0.295, rely=0.851, height=35, width=78)
         self.BAP.configure(**default_button_configuration)
         self.BAP.configure(text='''access to db''')
         self.BAP.configure(state=pg_buttons_default_state)
 
         self.BAT = tk.Button(top, command=button_convert_ac_to_txt)
-        self.BAT.place(relx=0.188, rely=0.851, height=35, width=90)
+        self.BAT.place(relx=0.156, rely=0.851, height=35, width=78)
         self.BAT.configure(**default_button_configuration)
         self.BAT.configure(text='''access to text''')
 
         self.BPA = tk.Button(top, command=button_convert_pg_to_ac)
-        self.BPA.place(relx=0.531, rely=0.851, height=35, width=80)
+        self.BPA.place(relx=0.433, rely=0.851, height=35, width=78)
         self.BPA.configure(**default_button_configuration)
         self.BPA.configure(text='''db to access''')
         self.BPA.configure(state=pg_buttons_default_state)
 
         self.BPT = tk.Button(top, command=button_convert_pg_to_txt)
-        self.BPT.place(relx=0.685, rely=0.851, height=35, width=80)
+        self.BPT.place(relx=0.572, rely=0.851, height=35, width=78)
         self.BPT.configure(**default_button_configuration)
         self.BPT.configure(text='''db to text''')
         self.BPT.configure(state=pg_buttons_default_state)
 
+        self.BTS = tk.Button(top, command=button_convert_txt_to_sqlite)
+        self.BTS.place(relx=0.849, rely=0.851, height=35, width=78)
+        self.BTS.configure(**default_button_configuration)
+        self.BTS.configure(text='''text to sqlite''')
+
+        self.status = tk.Label(top, anchor="w")
+        self.status.place(relx=0.017, rely=0.943, height=20, relwidth=0.8)
+        self.status.configure(**default_label_configuration)
+        self.status.configure(font=font9)
+        self.status.configure(textvariable=dbc_support.status)
+
+        self.BCC = tk.Button(top, command=cancel_conversion)
+        self.BCC.place(relx=0.839, rely=0.943, height=20, width=80)
+        self.BCC.configure(**default_button_configuration)
+        self.BCC.configure(text='''cancel''')
+        self.BCC.configure(state="disable")
+
+        self.conversion_buttons = (
+            self.BTP, self.BTA, self.BAP, self.BAT, self.BPA, self.BPT, self.BTS, self.BTC, )
+
+    def lock_conversion_buttons(self) -> dict:
+        """
+        Disables conversion buttons while a conversion is running
+        :return: Buttons' states to restore
+        """
+        states = {button: button.cget("state") for button in self.conversion_buttons}
+        for button in self.conversion_buttons:
+            button.configure(state="disable")
+        self.BCC.configure(state="normal")
+        return states
+
+    def unlock_conversion_buttons(self, states: dict):
+        """
+        Restores buttons' states after the conversion
+        :param states: Buttons' states returned by lock_conversion_buttons
+        :return:
+        """
+        for button, state in states.items():
+            button.configure(state=state)
+        self.BCC.configure(state="disable")
+
 
 # ======================================================
 # Support code for Balloon Help (also called tooltips).
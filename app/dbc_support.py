@@ -8,7 +8,7 @@
 from config.text import IMPORT_DIRECTORY_PATH_LOCAL, EXPORT_DIRECTORY_PATH_LOCAL
 from config.access import MDB_FILE_PATH
 
-global from_git, import_path, export_path, postgres_uri, access_path
+global from_git, import_path, export_path, postgres_uri, access_path, status
 
 try:
     import Tkinter as tk
@@ -24,12 +24,13 @@ except ImportError:
 
 
 def set_tk_variables():
-    global from_git, import_path, export_path, postgres_uri, access_path
+    global from_git, import_path, export_path, postgres_uri, access_path, status
     from_git = tk.IntVar(value=1)
     import_path = tk.StringVar(value=IMPORT_DIRECTORY_PATH_LOCAL)
     export_path = tk.StringVar(value=EXPORT_DIRECTORY_PATH_LOCAL)
     postgres_uri = tk.StringVar()
     access_path = tk.StringVar(value=MDB_FILE_PATH)
+    status = tk.StringVar(value="Ready")
 
 
 def init(top, gui, *args, **kwargs):
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Background execution of conversions for the GUI
+
+A conversion runs in a worker thread, so the Tk main loop stays responsive.
+The worker reports through a thread-safe channel (queue), which the main loop
+polls with root.after(). Progress is taken from the metrics stages:
+the current stage, rows per second of the last finished stage
+and the ETA based on the previous run of the same conversion,
+scaled by the pace of the current one.
+Cancellation is cooperative: the next started stage raises ConversionCancelled.
+Once a destructive stage (like drop_all) is started, a cancelled conversion
+leaves its target incomplete, the worker tells about it (see destructive)
+"""
+
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import log
+from config.metrics import METRICS_DIRECTORY_PATH, StageRecord, metrics
+
+PROGRESS, DONE, FAILED, CANCELLED = "progress", "done", "failed", "cancelled"
+
+
+class ConversionCancelled(Exception):
+    """The conversion was cancelled by the user"""
+
+
+class Progress(NamedTuple):
+    """Snapshot of a running conversion"""
+    stage: str
+    rows: Optional[int]
+    rows_per_second: Optional[float]
+    elapsed: float
+    eta: Optional[float]
+
+    def __str__(self) -> str:
+        parts = [self.stage]
+        if self.rows_per_second:
+            parts.append(f"{self.rows_per_second:,.0f} rows/s")
+        parts.append(f"elapsed {timedelta(seconds=round(self.elapsed))}")
+        parts.append(
+            f"ETA {timedelta(seconds=round(self.eta))}" if self.eta is not None else "ETA unknown")
+        return " | ".join(parts)
+
+
+def is_milestone(name: str) -> bool:
+    """
+    Milestones are the direct stages of a run, like 'txt_to_pg/fill_tables'
+    :param name: Stage path
+    :return:
+    """
+    return name.count("/") == 1
+
+
+def previous_offsets(run_name: str) -> Dict[str, float]:
+    """
+    Finish times of milestones (seconds since the run start)
+    from the last saved report of the run
+    :param run_name: Run name, like 'txt_to_pg'
+    :return: {stage path: seconds}, the run itself included, empty if there is no report
+    """
+    if not METRICS_DIRECTORY_PATH:
+        return {}
+    reports = sorted(glob.glob(os.path.join(METRICS_DIRECTORY_PATH, f"{run_name}_*.json")))
+    if not reports:
+        return {}
+    try:
+        with open(reports[-1], encoding="utf-8") as file:
+            stages = json.load(file)["stages"]
+        run_started = datetime.fromisoformat(stages[0]["started"])
+        return {item["stage"]: (
+            datetime.fromisoformat(item["started"]) - run_started).total_seconds() + item["seconds"]
+                for item in stages if item["stage"] == run_name or is_milestone(item["stage"])}
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as err:
+        log.warning("Cannot read metrics report %s: %s", reports[-1], err)
+        return {}
+
+
+class ConversionWorker:
+    """
+    Run one conversion at a time in a background thread
+    Messages of the channel are (kind, value) tuples:
+        (PROGRESS, Progress), (DONE, result), (FAILED, exception), (CANCELLED, destructive)
+    The last message of each conversion is DONE, FAILED or CANCELLED
+    """
+    report_interval = 0.2
+    # Stages that remove the existing data of the conversion's target
+    destructive_stages = ("drop_all", "clear_content")
+
+    def __init__(self):
+        self.thread = None
+        self.channel = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.history = {}
+        self.expected = {}
+        self.finished = {}
+        self.started_at = None
+        self.last_report = 0.0
+        self.last_finished = None
+        self.destructive = False
+
+    @property
+    def busy(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, function: Callable, *args, context=None, **kwargs) -> bool:
+        """
+        Start the conversion in a worker thread
+        :param function: Conversion function
+        :param context: Flask app context to push in the worker thread, if needed
+        :return: False if another conversion is still running
+        """
+        if self.busy:
+            return False
+        self.cancel_event.clear()
+        self.expected, self.finished = {}, {}
+        self.started_at = time.monotonic()
+        self.last_report, self.last_finished = 0.0, None
+        self.destructive = False
+        self.thread = threading.Thread(
+            target=self.run, args=(function, args, kwargs, context),
+            name="conversion-worker", daemon=True)
+        self.thread.start()
+        return True
+
+    def cancel(self) -> None:
+        """
+        Ask the running conversion to stop at the next stage
+        If the conversion is destructive already, its target is left incomplete
+        :return: None
+        """
+        if self.busy:
+            log.info("Conversion cancellation requested")
+            self.cancel_event.set()
+
+    def run(self, function: Callable, args: tuple, kwargs: dict, context) -> None:
+        metrics.add_listener(self.on_stage)
+        if context is not None:
+            context.push()
+        try:
+            result = function(*args, **kwargs)
+        except ConversionCancelled:
+            log.warning("Conversion cancelled")
+            self.channel.put((CANCELLED, self.destructive))
+        except Exception as err:  # pylint: disable=W0703
+            log.exception("Conversion failed")
+            self.channel.put((FAILED, err))
+        else:
+            self.channel.put((DONE, result))
+        finally:
+            if context is not None:
+                context.pop()
+            metrics.remove_listener(self.on_stage)
+
+    def on_stage(self, event_name: str, record: StageRecord) -> None:
+        """
+        Metrics listener, called in the thread of the stage
+        :param event_name: "start" or "finish"
+        :param record:
+        :return: None
+        """
+        name, now = record.name, time.monotonic()
+        if event_name == "start":
+            if self.cancel_event.is_set():
+                raise ConversionCancelled(name)
+            if name.rsplit("/", 1)[-1] in self.destructive_stages:
+                self.destructive = True
+            if "/" not in name and not self.expected:
+                self.expected = self.history.get(name) or previous_offsets(name)
+        else:
+            if is_milestone(name) or "/" not in name:
+                self.finished[name] = now - self.started_at
+            if "/" not in name:
+                self.history[name] = dict(self.finished)
+            if record.rows_per_second:
+                self.last_finished = record
+        if event_name == "start" and now - self.last_report >= self.report_interval \
+                or event_name == "finish" and is_milestone(name):
+            self.last_report = now
+            self.channel.put((PROGRESS, self.progress(name, now)))
+
+    def progress(self, stage: str, now: float) -> Progress:
+        """
+        :param stage: Name of the current stage
+        :param now: time.monotonic() value
+        :return: Progress snapshot
+        """
+        eta, elapsed = None, now - self.started_at
+        total = max(self.expected.values(), default=None)
+        if total:
+            # Pace of the last finished milestone against the previous run
+            done = [(offset, self.expected[name]) for name, offset in self.finished.items()
+                    if self.expected.get(name)]
+            pace = max(done)[0] / max(done)[1] if done else 1.0
+            eta = max(total * pace - elapsed, 0.0)
+        last = self.last_finished
+        return Progress(
+            stage=stage,
+            rows=last.rows if last else None,
+            rows_per_second=last.rows_per_second if last else None,
+            elapsed=elapsed,
+            eta=eta)
+
+    def poll(self) -> List[Tuple[str, object]]:
+        """
+        Take all messages waiting in the channel without blocking
+        :return: List of (kind, value)
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self.channel.get_nowait())
+            except queue.Empty:
+                return messages
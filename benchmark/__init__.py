@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for dictionary conversions
+
+generator - synthetic LOD text files of configurable size
+suite - timing of import, export and parsing stages with a JSON report
+stand_in - local HTTP stand-in for the Github and a check of the downloader
+
+Usage:
+    python -m benchmark --words 1000 10000 --postgres postgresql://... --output report.json
+"""
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Command line entry point of the benchmark suite
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from config import log
+from benchmark.suite import compare_reports, run_benchmark
+
+
+def main(arguments=None) -> int:
+    """
+    :param arguments: Command line arguments, sys.argv is used if None
+    :return: Exit code, 1 if there are regressions against the baseline
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark", description="Benchmark LOD conversions")
+    parser.add_argument("--words", type=int, nargs="+", default=[1000],
+                        help="sizes of synthetic dictionaries")
+    parser.add_argument("--postgres", action="append", default=[],
+                        help="local Postgres URI, all its tables are dropped")
+    parser.add_argument("--no-sqlite", action="store_true", help="skip SQLite backend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--baseline", help="previous report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slowdown against the baseline")
+    options = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        databases = {} if options.no_sqlite else {
+            "sqlite": f"sqlite:///{os.path.join(work_directory, 'benchmark.db')}"}
+        databases.update({
+            f"postgres{index if index else ''}": uri
+            for index, uri in enumerate(options.postgres)})
+        report = run_benchmark(
+            databases=databases, sizes=options.words, output_path=options.output,
+            seed=options.seed, work_directory=work_directory)
+
+    if not options.baseline:
+        return 0
+    with open(options.baseline, encoding="utf-8") as file:
+        regressions = compare_reports(json.load(file), report, options.threshold)
+    for entry in regressions:
+        log.warning("Regression: %s", entry)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Module for generating synthetic LOD dictionaries
+
+Files have the same structure as the real ones from the LOD project
+and roughly the same proportions: about a fifth of words are primitives,
+most of them have affixes and 'Used In' complexes,
+each word has one to three definitions with one to three «keys»
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+from config import log, SEPARATOR
+from config.postgres.models import Author, Event, Setting, Syllable, \
+    Type, Definition, Word, WordSpell
+from config.text.functions import save_to_file
+
+CONSONANTS = "bcdfgjklmnprstvz"
+VOWELS = "aeiou"
+
+# type, type_x, group, parentable, share of all words
+WORD_TYPES = (
+    ("C-Prim", "Predicate", "Prim", True, 0.12),
+    ("L-Prim", "Predicate", "Prim", True, 0.08),
+    ("2-Cpx", "Predicate", "Cpx", True, 0.30),
+    ("3-Cpx", "Predicate", "Cpx", True, 0.20),
+    ("LW", "Little Word", "Little", True, 0.15),
+    ("Afx", "Affix", "Afx", False, 0.0),  # generated for primitives
+)
+
+AUTHORS = (
+    ("JCB", "James Cooke Brown", "Inventor of Loglan"),
+    ("L4", "Loglan 4&5", "The Loglan book"),
+    ("RAM", "Robert A. McIvor", ""),
+    ("SLG", "Sheldon L. Gardner", ""),
+    ("ECH", "Emmett C. Hamilton", ""),
+    ("JSW", "John S. Whitehead", ""),
+    ("TTN", "Tommy T. Nielsen", ""),
+    ("RDC", "Randall D. Holmes", "Reformed Loglan"), )
+
+SYLLABLE_TYPES = (
+    ("InitialCC", True), ("MedialCC", True),
+    ("UnintelligibleCC", False), ("UnintelligibleCCC", False), )
+
+GRAMMAR_CODES = ("v", "n", "a", "p", "vi", "")
+
+
+class DictionaryGenerator:
+    """
+    Generate random but valid dictionary data
+    The same seed always gives the same files
+    """
+
+    def __init__(self, words: int = 1000, events: int = 10, seed: int = 0):
+        """
+        :param words: Number of words (not counting generated affixes)
+        :param events: Number of lexical events
+        :param seed: Random seed
+        """
+        self.words = words
+        self.events = events
+        self.random = random.Random(seed)
+        self.names = set()
+        self.vocabulary = [self.new_name("CVCCV") for _ in range(max(words // 2, 10))]
+        # Zipf-like frequencies, so some keys are used much more often
+        self.key_weights = [1 / rank for rank in range(1, len(self.vocabulary) + 1)]
+
+    def new_name(self, pattern: str) -> str:
+        """
+        :param pattern: Sequence of 'C' and 'V' letters
+        :return: Unique random name matching the pattern
+        """
+        while True:
+            name = "".join(
+                self.random.choice(CONSONANTS if letter == "C" else VOWELS) for letter in pattern)
+            if name not in self.names:
+                self.names.add(name)
+                return name
+            pattern += self.random.choice("CV")
+
+    def authors(self) -> List[str]:
+        """Author.txt lines"""
+        return [SEPARATOR.join(author) for author in AUTHORS]
+
+    def lex_events(self) -> List[str]:
+        """LexEvent.txt lines, one event every ~400 days from 1975"""
+        start = date(1975, 1, 1)
+        return [SEPARATOR.join((
+            str(number), f"Event {number}",
+            (start + timedelta(days=400 * number)).strftime("%m/%d/%Y"),
+            f"Definition of event {number}", f"Annotation {number}", f"EV{number}"))
+            for number in range(1, self.events + 1)]
+
+    def settings(self) -> List[str]:
+        """Settings.txt lines"""
+        return [SEPARATOR.join((
+            "25.10.2020 05:10:20", "2", str(self.words), "4.5.9"))]
+
+    def syllables(self) -> List[str]:
+        """Syllable.txt lines"""
+        count = min(len(CONSONANTS) ** 2, 100)
+        pairs = [first + second for first in CONSONANTS for second in CONSONANTS][:count]
+        return [SEPARATOR.join((pair, *map(str, SYLLABLE_TYPES[index % len(SYLLABLE_TYPES)])))
+                for index, pair in enumerate(pairs)]
+
+    def types(self) -> List[str]:
+        """Type.txt lines"""
+        return [SEPARATOR.join((
+            type_, type_x, group, str(parentable), f"{type_} words"))
+            for type_, type_x, group, parentable, _ in WORD_TYPES]
+
+    def words_data(self) -> List[dict]:
+        """
+        Generate words with relations between them
+        :return: List of dicts, one for each word
+        """
+        types = [item[0] for item in WORD_TYPES if item[4]]
+        weights = [item[4] for item in WORD_TYPES if item[4]]
+        patterns = {"C-Prim": "CCVCV", "L-Prim": "CVCCV", "2-Cpx": "CVCCVCV",
+                    "3-Cpx": "CVCCVCCVCV", "LW": "CV"}
+
+        words = [{"type": type_, "name": self.new_name(patterns[type_])}
+                 for type_ in self.random.choices(types, weights, k=self.words)]
+        complexes = [word["name"] for word in words if word["type"].endswith("Cpx")]
+
+        affixes = []
+        for word in words:
+            if word["type"].endswith("Prim") and self.random.random() < 0.7:
+                names = [self.new_name("CVC") for _ in range(self.random.randint(1, 2))]
+                word["affixes"] = names
+                affixes.extend({"type": "Afx", "name": name + self.random.choice(("", "-"))}
+                               for name in names)
+            if word["type"] in ("C-Prim", "L-Prim", "LW") \
+                    and complexes and self.random.random() < 0.6:
+                word["used_in"] = self.random.sample(
+                    complexes, min(len(complexes), self.random.randint(1, 5)))
+        words.extend(affixes)
+
+        for id_old, word in enumerate(words, 1):
+            word["id_old"] = id_old
+        return words
+
+    def words_lines(self, words: List[dict]) -> List[str]:
+        """Words.txt lines"""
+        authors = [author[0] for author in AUTHORS]
+        type_x = {item[0]: item[1] for item in WORD_TYPES}
+        lines = []
+        for word in words:
+            author = "/".join(self.random.sample(authors, self.random.choice((1, 1, 1, 2))))
+            lines.append(SEPARATOR.join((
+                str(word["id_old"]), word["type"], type_x[word["type"]],
+                " ".join(word.get("affixes", [])),
+                f"{self.random.randint(20, 80)}%" if word["type"].endswith("Prim") else "",
+                author + (" (notes)" if self.random.random() < 0.05 else ""),
+                str(self.random.randint(1975, 2020)) + (" (?)" if self.random.random() < 0.05 else ""),
+                f"{self.random.randint(1, 7)}.0" if self.random.random() < 0.5 else "",
+                "origin" if word["type"].endswith("Prim") else "",
+                "origin x" if word["type"] == "C-Prim" else "",
+                " | ".join(word.get("used_in", [])),
+                str(word["id_old"] + 10000) if self.random.random() < 0.3 else "", )))
+        return lines
+
+    def word_spell_lines(self, words: List[dict]) -> List[str]:
+        """WordSpell.txt lines, some words get an older spelling"""
+        lines = []
+        for word in words:
+            if self.events > 1 and self.random.random() < 0.03:
+                # Older spelling replaced by a later event
+                end = self.random.randint(2, self.events)
+                old_name = word["name"] + "a"
+                self.names.add(old_name)
+                lines.append(SEPARATOR.join((
+                    str(word["id_old"]), old_name, old_name,
+                    "55555", "1", str(end), "")))
+                start = end
+            else:
+                start = 1
+            lines.append(SEPARATOR.join((
+                str(word["id_old"]), word["name"], word["name"], "55555", str(start), "9999", "")))
+        return lines
+
+    def definition_lines(self, words: List[dict]) -> List[str]:
+        """WordDefinition.txt lines"""
+        lines = []
+        for word in words:
+            for position in range(1, self.random.randint(1, 3) + 1):
+                keys = self.random.choices(
+                    self.vocabulary, self.key_weights, k=self.random.randint(0, 3))
+                body = " ".join(f"«{key}»" for key in keys) or "no keys here"
+                grammar = self.random.choice(GRAMMAR_CODES)
+                slots = str(self.random.randint(1, 4)) if grammar else ""
+                lines.append(SEPARATOR.join((
+                    str(word["id_old"]), str(position), "",
+                    slots + grammar, f"K {body} B", "", "")))
+        return lines
+
+    def generate(self) -> Dict[str, List[str]]:
+        """
+        :return: Lines of each file by model name
+        """
+        words = self.words_data()
+        return {
+            Author.__name__: self.authors(),
+            Event.__name__: self.lex_events(),
+            Setting.__name__: self.settings(),
+            Syllable.__name__: self.syllables(),
+            Type.__name__: self.types(),
+            Word.__name__: self.words_lines(words),
+            WordSpell.__name__: self.word_spell_lines(words),
+            Definition.__name__: self.definition_lines(words), }
+
+
+def generate_dictionary(output_directory: str, words: int = 1000,
+                        events: int = 10, seed: int = 0) -> Dict[str, int]:
+    """
+    Write a synthetic dictionary to the directory
+    :param output_directory: Directory for text files (with trailing separator)
+    :param words: Number of words
+    :param events: Number of lexical events
+    :param seed: Random seed
+    :return: Number of lines of each file by model name
+    """
+    models = {model.__name__: model for model in (
+        Author, Event, Setting, Syllable, Type, Word, WordSpell, Definition)}
+    files = DictionaryGenerator(words=words, events=events, seed=seed).generate()
+    result = {model_name: save_to_file(
+        f"{output_directory}{models[model_name].file_name}", lines).lines
+        for model_name, lines in files.items()}
+    log.info("Synthetic dictionary with %s words generated in %s", words, output_directory)
+    return result
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP stand-in for the Github and a check of the downloader against it
+
+The server serves files from memory like Github raw does:
+with an ETag, conditional requests, Range / If-Range requests
+and gzip encoding for clients that accept it.
+The check covers a plain download, the 304 reply to a repeated one,
+the 206 resume of a part and the 416 restart of a part that does not fit
+
+Usage:
+    python -m benchmark.stand_in
+"""
+
+import gzip
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+from config import log
+from config.text.downloader import DOWNLOADED, NOT_MODIFIED, RESUMED, Downloader
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serve the server's files, its status codes are collected in server.statuses"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.reply(404)
+            return
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        headers = {"ETag": etag}
+
+        if self.headers.get("If-None-Match") == etag:
+            self.reply(304, headers=headers)
+            return
+
+        # Like Github, ranges are positions in the encoded content
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            content = gzip.compress(content, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) == etag:
+            offset = int(range_header[len("bytes="):].split("-")[0])
+            if offset >= len(content):
+                self.reply(416, headers={"Content-Range": f"bytes */{len(content)}"})
+                return
+            headers["Content-Range"] = f"bytes {offset}-{len(content) - 1}/{len(content)}"
+            self.reply(206, content[offset:], headers)
+            return
+        self.reply(200, content, headers)
+
+    def reply(self, status: int, body: bytes = b"", headers: Dict[str, str] = None) -> None:
+        self.server.statuses.append(status)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@contextmanager
+def stand_in_server(files: Dict[str, bytes]) -> Iterator[ThreadingHTTPServer]:
+    """
+    Run the stand-in server on a free local port
+    :param files: Content of files by their URL paths
+    :return: Server, its base URL is server.url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.files = files
+    server.statuses = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def check_downloader() -> List[str]:
+    """
+    Download a file from the stand-in server in all supported ways
+    :return: List of failed checks, empty if the downloader works
+    """
+    content = "".join(f"{index}@word{index}@definition {index}\n" for index in range(5000)).encode()
+    failures = []
+
+    def expect(name: str, result, status: str, reply: int, server) -> None:
+        with open(result.path, "rb") as file:
+            data = file.read()
+        if result.status != status or server.statuses[-1] != reply or data != content:
+            failures.append(f"{name}: {result.status}, reply {server.statuses[-1]}, "
+                            f"{'same' if data == content else 'different'} content")
+
+    with tempfile.TemporaryDirectory() as mirror_directory, \
+            stand_in_server({"/tables/Word.txt": content}) as server, \
+            Downloader(mirror_directory, fresh_seconds=0) as downloader:
+        url = f"{server.url}/tables/Word.txt"
+        expect("download", downloader.fetch(url), DOWNLOADED, 200, server)
+        expect("repeat", downloader.fetch(url), NOT_MODIFIED, 304, server)
+
+        path = downloader.mirror_path(url)
+        meta = dict(downloader.read_meta(path), partial=True)
+        with open(path + downloader.part_suffix, "wb") as file:
+            file.write(content[:len(content) // 3])
+        downloader.write_meta(path, meta)
+        expect("resume", downloader.fetch(url), RESUMED, 206, server)
+
+        with open(path + downloader.part_suffix, "wb") as file:
+            file.write(content + b"stale tail")
+        downloader.write_meta(path, meta)
+        expect("restart", downloader.fetch(url), DOWNLOADED, 200, server)
+        if 416 not in server.statuses:
+            failures.append("restart: no 416 reply")
+        if os.path.exists(path + downloader.part_suffix):
+            failures.append("restart: the part is left")
+
+    for failure in failures:
+        log.warning("Downloader check failed: %s", failure)
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_downloader() else 0)
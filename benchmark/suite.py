@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Module for timing conversion stages on synthetic dictionaries
+
+Each stage of convert_txt_to_pg (parsing, tables creation, filling, linking),
+the pipelined import, convert_pg_to_txt and the parsing functions
+are timed against every given database. Results are saved as a JSON report
+"""
+
+import json
+import os
+import platform
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from loglan_db import db
+
+from config import log, DEFAULT_LANGUAGE, SEPARATOR
+from config.postgres.models import all_models_pg
+from config.text.cache import DatasetCache
+from config.text.functions import download_dictionary_file, load_dictionary_file
+from converters.pg_to_txt import convert_pg_to_txt, pg_worker_context
+from converters.txt_to_pg import pipelined_convert_to_pg
+from converters.txt_to_pg.txt_to_pg_functions_fill import db_fill_tables, get_dataset_for_converters
+from converters.txt_to_pg.txt_to_pg_functions_link import db_link_tables
+from benchmark.generator import generate_dictionary
+
+
+class BenchmarkRecorder:
+    """Collect timings of stages as report entries"""
+
+    def __init__(self):
+        self.results = []
+
+    def measure(self, stage: str, function: Callable, *args,
+                rows: Optional[int] = None, **context):
+        """
+        Run the function and record its wall time
+        :param stage: Stage name
+        :param function: Callable to measure
+        :param args: Arguments for the callable
+        :param rows: Number of processed rows, if known
+        :param context: Additional fields for the entry, like backend or words
+        :return: Function's result
+        """
+        start_time = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start_time
+        entry = {**context, "stage": stage, "seconds": round(seconds, 6), "rows": rows,
+                 "rows_per_second": round(rows / seconds, 1) if rows and seconds else None}
+        self.results.append(entry)
+        log.info("BENCHMARK %s: %.3f s", entry, seconds)
+        return result
+
+
+@contextmanager
+def temporary_cache() -> Iterator[DatasetCache]:
+    """
+    Empty dataset cache in a temporary directory, so parsing stages
+    do not depend on the default cache and do not fill it
+    :return: DatasetCache
+    """
+    with tempfile.TemporaryDirectory() as cache_directory:
+        yield DatasetCache(directory=cache_directory, size_limit=1024 ** 3)
+
+
+def benchmark_parsing(recorder: BenchmarkRecorder, source_directory: str,
+                      file_lines: Dict[str, int], **context) -> None:
+    """
+    Time parsing of each file without cache, with a cold cache and with a warm one
+    :param recorder:
+    :param source_directory:
+    :param file_lines: Number of lines of each file by model name
+    :param context:
+    :return: None
+    """
+    models = {model.__name__: model for model in all_models_pg}
+    with temporary_cache() as cache:
+        for model_name, lines in file_lines.items():
+            url = f"{source_directory}{models[model_name].file_name}"
+            recorder.measure(f"parse:{model_name}", download_dictionary_file,
+                             url, model_name, SEPARATOR, rows=lines, **context)
+            for stage in ("parse_cache_cold", "parse_cache_warm"):
+                recorder.measure(f"{stage}:{model_name}", load_dictionary_file,
+                                 url, model_name, SEPARATOR, cache, rows=lines, **context)
+
+
+def benchmark_database(recorder: BenchmarkRecorder, database_uri: str,
+                       source_directory: str, output_directory: str,
+                       total_lines: int, **context) -> None:
+    """
+    Time import and export stages against one database
+    ! All existing tables of the database are dropped
+    :param recorder:
+    :param database_uri:
+    :param source_directory:
+    :param output_directory:
+    :param total_lines: Number of lines in all source files
+    :param context:
+    :return: None
+    """
+    def count_rows() -> int:
+        rows = sum(model.query.count() for model in all_models_pg if model.__load_to_db__)
+        # Release the session's locks, the next stage may drop tables
+        db.session.commit()
+        return rows
+
+    with pg_worker_context(database_uri), temporary_cache() as cache:
+        dataset = recorder.measure(
+            "txt_to_pg:get_dataset", get_dataset_for_converters,
+            source_directory, DEFAULT_LANGUAGE, cache, rows=total_lines, **context)
+        recorder.measure("txt_to_pg:drop_all", db.drop_all, **context)
+        recorder.measure("txt_to_pg:create_all", db.create_all, **context)
+        recorder.measure("txt_to_pg:fill_tables", db_fill_tables, dataset, **context)
+        recorder.measure("txt_to_pg:link_tables", db_link_tables, dataset, **context)
+        recorder.results[-2]["rows"] = count_rows()
+
+        cache.clear()
+        recorder.measure("txt_to_pg:pipelined",
+                         partial(pipelined_convert_to_pg, deferred=True, cache=cache),
+                         source_directory, DEFAULT_LANGUAGE, rows=total_lines, **context)
+
+        rows = count_rows()
+        recorder.measure("pg_to_txt:list", convert_pg_to_txt,
+                         output_directory, False, rows=rows, **context)
+        recorder.measure("pg_to_txt:streaming", convert_pg_to_txt,
+                         output_directory, True, rows=rows, **context)
+        recorder.measure("pg_to_txt:threads", convert_pg_to_txt,
+                         output_directory, True, 4, rows=rows, **context)
+
+
+def run_benchmark(databases: Dict[str, str], sizes: Sequence[int] = (1000, ),
+                  output_path: str = "benchmark_report.json", seed: int = 0,
+                  work_directory: Optional[str] = None) -> dict:
+    """
+    Generate dictionaries of each size and time all stages on all databases
+    :param databases: Database URIs by backend name, like {"sqlite": "sqlite:///..."}
+    :param sizes: Numbers of words in synthetic dictionaries
+    :param output_path: Path of the JSON report
+    :param seed: Random seed of the generator
+    :param work_directory: Directory for generated and exported files,
+        a temporary one is used if None
+    :return: Report as dict
+    """
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": [], }
+    recorder = BenchmarkRecorder()
+    recorder.results = report["results"]
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        work_directory = work_directory or temp_directory
+        for words in sizes:
+            source_directory = os.path.join(work_directory, f"source_{words}", "")
+            file_lines = recorder.measure(
+                "generate", generate_dictionary, source_directory, words, 10, seed, words=words)
+            recorder.results[-1]["rows"] = sum(file_lines.values())
+
+            benchmark_parsing(recorder, source_directory, file_lines, words=words)
+            for backend, database_uri in databases.items():
+                benchmark_database(
+                    recorder, database_uri, source_directory,
+                    os.path.join(work_directory, f"export_{backend}_{words}", ""),
+                    sum(file_lines.values()), backend=backend, words=words)
+
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    log.info("Benchmark report saved to %s", output_path)
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float = 0.2) -> List[dict]:
+    """
+    Find stages which became slower than in the baseline report
+    :param baseline: Previous report
+    :param current: New report
+    :param threshold: Allowed relative slowdown, 0.2 means 20%
+    :return: List of regressed entries with both timings
+    """
+    def key(entry: dict) -> tuple:
+        return entry.get("backend"), entry.get("words"), entry["stage"]
+
+    baseline_seconds = {key(entry): entry["seconds"] for entry in baseline["results"]}
+    regressions = []
+    for entry in current["results"]:
+        before = baseline_seconds.get(key(entry))
+        if before and entry["seconds"] > before * (1 + threshold):
+            regressions.append({**entry, "baseline_seconds": before})
+    return regressions
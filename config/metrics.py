@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of conversion stages
+
+Every stage records its wall time, processed rows, rows per second,
+database round trips (executed statements and COPY calls, for all engines)
+and peak memory. Round trips of a stage are counted in its own thread only,
+so stages of parallel workers do not count each other's statements,
+the outermost run counts round trips of all threads. Stages are nested, their names form a path like
+'txt_to_pg/fill_tables/Word'. When the outermost run is finished,
+the report is logged and saved as JSON to METRICS_DIRECTORY_PATH
+and as a Prometheus text file to METRICS_PROMETHEUS_DIRECTORY, if they are set.
+Listeners (see MetricsRecorder.add_listener) are told about every started
+and finished stage, e.g. to show the progress of a conversion
+
+Peak memory is taken from tracemalloc when METRICS_TRACE_MEMORY=1
+(precise per stage, but slower), otherwise it is the process' peak RSS so far
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import log
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DIRECTORY_PATH = os.getenv("METRICS_DIRECTORY_PATH", "")
+METRICS_PROMETHEUS_DIRECTORY = os.getenv("METRICS_PROMETHEUS_DIRECTORY", "")
+METRICS_TRACE_MEMORY = os.getenv("METRICS_TRACE_MEMORY", "0") == "1"
+
+
+class RoundTripCounter:
+    """Thread-safe counter of database round trips, in total and per thread"""
+
+    def __init__(self):
+        self.total = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def add(self, number: int = 1) -> None:
+        self.local.count = self.thread_count + number
+        with self.lock:
+            self.total += number
+
+    @property
+    def thread_count(self) -> int:
+        """
+        :return: Round trips of the current thread
+        """
+        return getattr(self.local, "count", 0)
+
+
+round_trips = RoundTripCounter()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_round_trip(*_) -> None:
+    """Count every statement sent by any engine"""
+    round_trips.add()
+
+
+def process_peak_memory() -> Optional[int]:
+    """
+    :return: Peak resident memory of the process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageRecord:
+    """Metrics of one stage"""
+    __slots__ = ("name", "started", "seconds", "rows", "round_trips",
+                 "peak_memory", "start_time", "start_round_trips", "all_threads")
+
+    def __init__(self, name: str, all_threads: bool = False):
+        """
+        :param name:
+        :param all_threads: Count round trips of all threads, not only of the current one
+        """
+        self.name = name
+        self.all_threads = all_threads
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.seconds = None
+        self.rows = None
+        self.round_trips = None
+        self.peak_memory = 0
+        self.start_time = time.perf_counter()
+        self.start_round_trips = self.current_round_trips()
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if not self.rows or not self.seconds:
+            return None
+        return round(self.rows / self.seconds, 1)
+
+    def current_round_trips(self) -> int:
+        return round_trips.total if self.all_threads else round_trips.thread_count
+
+    def finish(self) -> None:
+        self.seconds = round(time.perf_counter() - self.start_time, 6)
+        self.round_trips = self.current_round_trips() - self.start_round_trips
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "started": self.started,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "rows_per_second": self.rows_per_second,
+            "round_trips": self.round_trips,
+            "peak_memory_bytes": self.peak_memory or None, }
+
+
+class MetricsRecorder:
+    """
+    Collect stage records of the current run
+    Each thread has its own stack of open stages,
+    stages of worker threads are attached to the run itself
+    """
+
+    def __init__(self):
+        self.run_name = None
+        self.records = []
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def add_listener(self, listener: Callable[[str, StageRecord], None]) -> None:
+        """
+        Call the listener with ("start", record) and ("finish", record) for every stage
+        Listeners are called in the thread of the stage.
+        An exception raised on "start" aborts the stage before it is entered
+        :param listener:
+        :return: None
+        """
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, StageRecord], None]) -> None:
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def notify(self, event_name: str, record: StageRecord) -> None:
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(event_name, record)
+
+    def stack(self) -> List[StageRecord]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def update_peaks(self) -> int:
+        """
+        Pass the current traced peak to all open stages of the thread
+        and start measuring a new peak
+        :return: Current peak in bytes
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.stack():
+            record.peak_memory = max(record.peak_memory, peak)
+        tracemalloc.reset_peak()
+        return peak
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None,
+              all_threads: bool = False) -> Iterator[StageRecord]:
+        """
+        Measure the block as a stage
+        The number of rows may be set later through the yielded record
+        :param name: Stage name, unique among siblings
+        :param rows: Number of processed rows, if known
+        :param all_threads: Count round trips of all threads (for the run)
+        :return: StageRecord
+        """
+        stack = self.stack()
+        parent = stack[-1].name if stack else self.run_name
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            self.update_peaks()
+
+        record = StageRecord(
+            f"{parent}/{name}" if parent and parent != name else name, all_threads=all_threads)
+        record.rows = rows
+        self.notify("start", record)
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            stack.pop()
+            record.finish()
+            if tracing:
+                record.peak_memory = max(record.peak_memory, self.update_peaks())
+            else:
+                record.peak_memory = process_peak_memory() or 0
+            with self.lock:
+                self.records.append(record)
+            log.info("STAGE %s: %.3f s, %s rows, %s rows/s, %s round trips",
+                     record.name, record.seconds, record.rows,
+                     record.rows_per_second, record.round_trips)
+            self.notify("finish", record)
+
+    @contextmanager
+    def run(self, name: str) -> Iterator[StageRecord]:
+        """
+        Measure the whole conversion and emit the report at its end
+        A run inside another run is just a stage of it
+        :param name: Run name, like 'txt_to_pg'
+        :return: StageRecord of the run
+        """
+        if self.run_name is not None:
+            with self.stage(name) as record:
+                yield record
+            return
+
+        self.run_name, self.records = name, []
+        started_tracing = METRICS_TRACE_MEMORY and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            with self.stage(name, all_threads=True) as record:
+                yield record
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            self.emit()
+            self.run_name = None
+
+    def report(self) -> dict:
+        """
+        :return: Report of the last run as dict
+        """
+        return {
+            "run": self.run_name,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "stages": [record.as_dict() for record in sorted(
+                self.records, key=lambda record: record.start_time)], }
+
+    def prometheus(self) -> str:
+        """
+        :return: Report of the last run in Prometheus text exposition format
+        """
+        metrics = (
+            ("seconds", "Wall time of the conversion stage", "seconds"),
+            ("rows", "Rows processed by the conversion stage", "rows"),
+            ("rows_per_second", "Rows processed per second", "rows_per_second"),
+            ("round_trips", "Database round trips of the conversion stage", "round_trips"),
+            ("peak_memory_bytes", "Peak memory of the conversion stage", "peak_memory_bytes"), )
+        stages = self.report()["stages"]
+        lines = []
+        for metric, description, field in metrics:
+            lines.append(f"# HELP lod_stage_{metric} {description}")
+            lines.append(f"# TYPE lod_stage_{metric} gauge")
+            lines.extend(
+                f'lod_stage_{metric}{{run="{self.run_name}",stage="{item["stage"]}"}} {item[field]}'
+                for item in stages if item[field] is not None)
+        lines.append("# HELP lod_run_timestamp_seconds Finish time of the last run")
+        lines.append("# TYPE lod_run_timestamp_seconds gauge")
+        lines.append(f'lod_run_timestamp_seconds{{run="{self.run_name}"}} {time.time():.0f}')
+        return "\n".join(lines) + "\n"
+
+    def emit(self) -> None:
+        """
+        Log the report and save it to configured files
+        :return: None
+        """
+        report = self.report()
+        log.debug("METRICS %s", json.dumps(report))
+        if METRICS_DIRECTORY_PATH:
+            write_atomically(os.path.join(
+                METRICS_DIRECTORY_PATH,
+                f"{self.run_name}_{datetime.now().strftime('%y%m%d%H%M%S')}.json"),
+                json.dumps(report, indent=2))
+        if METRICS_PROMETHEUS_DIRECTORY:
+            write_atomically(os.path.join(
+                METRICS_PROMETHEUS_DIRECTORY, f"lod_{self.run_name}.prom"), self.prometheus())
+
+
+def write_atomically(path: str, content: str) -> None:
+    """
+    Write a file through a temporary one, so scrapers never see a partial file
+    :param path:
+    :param content:
+    :return: None
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+    log.info("Metrics saved to %s", path)
+
+
+metrics = MetricsRecorder()
+
+
+def count_result_rows(result) -> Optional[int]:
+    """
+    :param result: Value returned by an instrumented function
+    :return: Number of rows if it can be found without consuming the result
+    """
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    rows = getattr(result, "rows", result)
+    return len(rows) if hasattr(rows, "__len__") and not isinstance(rows, str) else None
+
+
+def instrumented(name: Optional[str] = None) -> Callable:
+    """
+    Decorator measuring each call of the function as a stage
+    The number of rows is taken from the result (int, list, TableRows)
+    :param name: Stage name, the function's name by default
+    :return: decorator
+    """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.stage(name or function.__name__) as record:
+                result = function(*args, **kwargs)
+                if record.rows is None:
+                    record.rows = count_result_rows(result)
+                return result
+        return wrapper
+    return decorator
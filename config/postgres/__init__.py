@@ -4,5 +4,24 @@
 Initializing application module
 """
 
+import os
+
+__all__ = ["LIVE_SCHEMA", "STAGING_SCHEMA", "PREVIOUS_SCHEMA",
+           "READER_ROLES", "STAGING_MIN_ROWS_RATIO", ]
+
+# Schemas of the staged import: the new dictionary is built in the staging one
+# and swapped with the live one, which is kept as the previous one for rollback.
+# The live one is a dedicated schema, readers should have it in their search_path
+LIVE_SCHEMA = os.getenv("LIVE_SCHEMA", "lod")
+STAGING_SCHEMA = os.getenv("STAGING_SCHEMA", "lod_staging")
+PREVIOUS_SCHEMA = os.getenv("PREVIOUS_SCHEMA", "lod_previous")
+
+# Comma separated roles of read-only services, they get access to the staging schema
+# in addition to the privileges copied from the live one
+READER_ROLES = [role.strip() for role in os.getenv("READER_ROLES", "").split(",") if role.strip()]
+
+# Staging tables with fewer rows than this part of the live ones are not swapped
+STAGING_MIN_ROWS_RATIO = float(os.getenv("STAGING_MIN_ROWS_RATIO", 0.9))
+
 if __name__ == "__main__":
     pass
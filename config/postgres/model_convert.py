@@ -15,6 +15,7 @@ class ConvertBase:
     __load_from_file__ = True
     __load_to_file__ = True
     __load_to_db__ = True
+    __sync_keys__ = ("id", )
     file_name = None
 
     @classmethod
@@ -41,6 +42,7 @@ class ConvertAuthor(ConvertBase):
     """
     __index_sort_import__ = 1
     __index_sort_export__ = 1
+    __sync_keys__ = ("abbreviation", )
     file_name = "Author.txt"
 
 
@@ -59,6 +61,7 @@ class ConvertKey(ConvertBase):
     """
     __index_sort_import__ = 3
     __index_sort_export__ = 8
+    __sync_keys__ = ("word", "language", )
     __load_from_file__ = False
     __load_to_file__ = False
 
@@ -71,6 +74,7 @@ class ConvertSetting(ConvertBase):
     """
     __index_sort_import__ = 4
     __index_sort_export__ = 4
+    __sync_keys__ = ("db_release", )
     file_name = "Settings.txt"
 
 
@@ -80,6 +84,7 @@ class ConvertSyllable(ConvertBase):
     """
     __index_sort_import__ = 5
     __index_sort_export__ = 5
+    __sync_keys__ = ("name", "type", )
     file_name = "Syllable.txt"
 
 
@@ -89,6 +94,7 @@ class ConvertType(ConvertBase):
     """
     __index_sort_import__ = 6
     __index_sort_export__ = 6
+    __sync_keys__ = ("type", )
     file_name = "Type.txt"
 
 
@@ -98,6 +104,7 @@ class ConvertDefinition(ConvertBase):
     """
     __index_sort_import__ = 8
     __index_sort_export__ = 2
+    __sync_keys__ = ("word_id", "position", )
     file_name = "WordDefinition.txt"
 
 
@@ -107,6 +114,7 @@ class ConvertWord(ConvertBase):
     """
     __index_sort_import__ = 7
     __index_sort_export__ = 8
+    __sync_keys__ = ("id_old", "name", )
     file_name = "Words.txt"
 
 
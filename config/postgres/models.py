@@ -4,6 +4,8 @@ This module contains default classes for LOD data conversion
 # pylint: disable=too-many-ancestors
 
 from loglan_db.model import Key as SourceKey, WordSource as SourceWordSource
+from loglan_db.model_db.base_connect_tables import \
+    t_connect_authors, t_connect_keys, t_connect_words  # pylint: disable=unused-import
 
 from loglan_db.model_export import ExportAuthor, ExportEvent, \
     ExportSetting, ExportSyllable, ExportType, \
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module for configuration data of SQLite dictionary file
+"""
+
+import os
+
+from config import log, root_directory
+
+__all__ = ["SQLITE_FILE_PATH", "SQLITE_CACHE_SIZE", "sqlite_uri",
+           "set_bulk_load_pragmas", "lookup_indexes", ]
+
+SQLITE_FILE_PATH = os.getenv(
+    "SQLITE_FILE_PATH",
+    os.path.join(root_directory or ".", "LoglanDictionary.db"))
+
+# Page cache of each connection during the load, in KiB
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", 512 * 1024))
+
+# Indexes for lookups in the finished dictionary file (table, columns),
+# they are built after all data is loaded
+lookup_indexes = (
+    ("words", ("name", )),
+    ("words", ("id_old", )),
+    ("definitions", ("word_id", )),
+    ("connect_words", ("child_id", )),
+    ("connect_authors", ("WID", )),
+    ("connect_keys", ("DID", )), )
+
+
+def sqlite_uri(db_path: str) -> str:
+    """
+    :param db_path: Path of the SQLite file
+    :return: SQLAlchemy URI of the file
+    """
+    return f"sqlite:///{os.path.abspath(db_path)}"
+
+
+def set_bulk_load_pragmas(dbapi_connection, _) -> None:
+    """
+    Engine 'connect' listener, which trades durability for load speed:
+    the file is built from scratch and is thrown away if the load fails
+    :param dbapi_connection: sqlite3.Connection
+    :return: None
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+    log.debug("SQLite bulk load pragmas are set")
@@ -10,3 +10,7 @@ IMPORT_DIRECTORY_PATH_REMOTE = os.getenv(
     "https://raw.githubusercontent.com/torrua/LOD/master/tables/")
 IMPORT_DIRECTORY_PATH_LOCAL = os.getenv("IMPORT_DIRECTORY_PATH_LOCAL", f"{root_directory}import\\")
 EXPORT_DIRECTORY_PATH_LOCAL = os.getenv("EXPORT_DIRECTORY_PATH_LOCAL", f"{root_directory}export\\")
+DATASET_CACHE_DIRECTORY_PATH_LOCAL = os.getenv("DATASET_CACHE_DIRECTORY_PATH_LOCAL", f"{root_directory}cache\\")
+DATASET_CACHE_SIZE_LIMIT = int(os.getenv("DATASET_CACHE_SIZE_LIMIT", 256 * 1024 * 1024))
+DOWNLOAD_MIRROR_DIRECTORY_PATH_LOCAL = os.getenv("DOWNLOAD_MIRROR_DIRECTORY_PATH_LOCAL", f"{root_directory}mirror\\")
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4))
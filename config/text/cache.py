@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache for parsed text datasets
+Each entry is keyed by the source file content hash,
+so unchanged files are never parsed twice
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import List, Optional
+
+from config import log
+from config.text import DATASET_CACHE_DIRECTORY_PATH_LOCAL, DATASET_CACHE_SIZE_LIMIT
+
+
+class DatasetCache:
+    """
+    Store parsed rows as pickle files with a total size limit
+    The least recently used entries are evicted first
+    """
+    suffix = ".pickle"
+
+    def __init__(self, directory: str = DATASET_CACHE_DIRECTORY_PATH_LOCAL,
+                 size_limit: int = DATASET_CACHE_SIZE_LIMIT):
+        """
+        :param directory: Directory for cache files
+        :param size_limit: Maximum total size of cache files in bytes
+        """
+        self.directory = directory
+        self.size_limit = size_limit
+
+    @staticmethod
+    def key(content: bytes, separator: str) -> str:
+        """
+        Generate cache key from the source file content
+        :param content: raw file content
+        :param separator: separation symbol used for parsing
+        :return: hex digest
+        """
+        return hashlib.sha256(content + separator.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        """
+        :param key:
+        :return: full path of the cache file for the key
+        """
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key: str) -> Optional[List[List[str]]]:
+        """
+        Load parsed rows from cache
+        :param key:
+        :return: rows or None if there is no such entry
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                rows = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError) as err:
+            if os.path.exists(path):
+                log.warning("Cannot read cache file %s: %s", path, err)
+            return None
+        os.utime(path)
+        return rows
+
+    def put(self, key: str, rows: List[List[str]]) -> None:
+        """
+        Save parsed rows to cache and evict old entries if necessary
+        :param key:
+        :param rows:
+        :return: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                pickle.dump(rows, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(key))
+        except OSError as err:
+            log.warning("Cannot write cache file for %s: %s", key, err)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits the size limit
+        :return: None
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.size_limit:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total_size -= size
+            log.debug("Cache file %s evicted", name)
+
+    def clear(self) -> None:
+        """
+        Remove all cache entries
+        :return: None
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                os.remove(os.path.join(self.directory, name))
+
+
+def get_dataset_cache() -> Optional[DatasetCache]:
+    """
+    Default dataset cache, disabled if the size limit is not positive
+    :return: DatasetCache or None
+    """
+    return DatasetCache() if DATASET_CACHE_SIZE_LIMIT > 0 else None
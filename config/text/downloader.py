@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, resumable downloads of LOD source files
+
+Every downloaded file is kept in a local mirror directory
+(<mirror>/<host>/<path>) with a small metadata file holding its ETag
+and Last-Modified values. The next download of the same URL is a
+conditional request, so unchanged files are not transferred again.
+An interrupted download is kept as a '.part' file and continued
+with a Range request, if the server's copy has not changed meanwhile.
+Files are requested without content encoding, so the size of the part
+and the Range offset count the same bytes.
+
+All requests share one keep-alive connection pool.
+The base URL is just a parameter (see IMPORT_DIRECTORY_PATH_REMOTE),
+so any local HTTP server can stand in for the Github
+(see benchmark.stand_in)
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import log
+from config.text import DOWNLOAD_MIRROR_DIRECTORY_PATH_LOCAL, DOWNLOAD_WORKERS
+
+DOWNLOADED, NOT_MODIFIED, RESUMED = "downloaded", "not_modified", "resumed"
+
+
+class DownloadResult(NamedTuple):
+    """Result of one file download"""
+    url: str
+    path: str
+    status: str
+    size: int
+
+
+class Downloader:
+    """
+    Download files to the local mirror through a shared session
+    The object is safe to use from several threads
+    """
+    part_suffix = ".part"
+    meta_suffix = ".meta.json"
+
+    def __init__(self, mirror_directory: str = DOWNLOAD_MIRROR_DIRECTORY_PATH_LOCAL,
+                 workers: int = DOWNLOAD_WORKERS, session: Optional[requests.Session] = None,
+                 timeout: float = 30, chunk_size: int = 64 * 1024, retries: int = 3,
+                 fresh_seconds: float = 60):
+        """
+        :param mirror_directory: Directory for downloaded files
+        :param workers: Number of parallel downloads (and pooled connections)
+        :param session: requests.Session to use, a new one if None
+        :param timeout: Connection and read timeout in seconds
+        :param chunk_size: Size of response chunks written to the file
+        :param retries: Number of attempts for each file, interrupted ones are resumed
+        :param fresh_seconds: Mirrored files checked so recently are not requested again
+        """
+        self.mirror_directory = mirror_directory
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.retries = max(retries, 1)
+        self.fresh_seconds = fresh_seconds
+        self.checked = {}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def mirror_path(self, url: str) -> str:
+        """
+        :param url:
+        :return: Local path of the URL's copy in the mirror
+        """
+        parsed = urlparse(url)
+        parts = [unquote(part) for part in parsed.path.split("/") if part not in ("", ".", "..")]
+        return os.path.join(self.mirror_directory, parsed.netloc.replace(":", "_"), *parts)
+
+    def read_meta(self, path: str) -> dict:
+        try:
+            with open(path + self.meta_suffix, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, path: str, meta: dict) -> None:
+        temp_path = f"{path}{self.meta_suffix}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(temp_path, path + self.meta_suffix)
+
+    @staticmethod
+    def validators(response: requests.Response) -> dict:
+        """
+        :param response:
+        :return: ETag and Last-Modified values of the response
+        """
+        return {"etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"), }
+
+    def fetch(self, url: str) -> DownloadResult:
+        """
+        Download the URL to the mirror, unless the mirrored copy is up to date
+        :param url:
+        :return: DownloadResult
+        """
+        path = self.mirror_path(url)
+        checked = self.checked.get(url)
+        if checked is not None and time.monotonic() - checked < self.fresh_seconds \
+                and os.path.exists(path):
+            return DownloadResult(url, path, NOT_MODIFIED, os.path.getsize(path))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for attempt in range(1, self.retries + 1):
+            try:
+                result = self.try_fetch(url, path)
+                self.checked[url] = time.monotonic()
+                return result
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as err:
+                if attempt == self.retries:
+                    raise
+                log.warning("Download of %s interrupted (attempt %s of %s): %s",
+                            url, attempt, self.retries, err)
+        raise RuntimeError(f"Cannot download {url}")
+
+    def try_fetch(self, url: str, path: str) -> DownloadResult:
+        """
+        One attempt of fetch(): a conditional request for a complete copy,
+        a range request for a partial one, a plain request otherwise
+        :param url:
+        :param path: Mirror path of the URL
+        :return: DownloadResult
+        """
+        part_path = path + self.part_suffix
+        meta = self.read_meta(path)
+        # Not gzip, which requests asks by default: Range offsets are positions in encoded data
+        headers = {"Accept-Encoding": "identity"}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = meta.get("etag") or meta.get("last_modified")
+        if offset and meta.get("partial") and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        elif os.path.exists(path) and not meta.get("partial"):
+            offset = 0
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        else:
+            offset = 0
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                log.debug("%s is not modified", url)
+                return DownloadResult(url, path, NOT_MODIFIED, os.path.getsize(path))
+            if response.status_code == 416 and offset:
+                # The part does not fit the server's copy, start from scratch
+                os.remove(part_path)
+                self.write_meta(path, {"url": url})
+                return self.try_fetch(url, path)
+            response.raise_for_status()
+
+            resumed = response.status_code == 206 and offset > 0
+            meta = dict(self.validators(response), url=url, partial=True)
+            encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+            # The part of an encoded response holds decoded bytes, it cannot be resumed
+            self.write_meta(path, {"url": url} if encoded else meta)
+            with open(part_path, "ab" if resumed else "wb") as file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+
+        size = os.path.getsize(part_path)
+        os.replace(part_path, path)
+        meta["partial"] = False
+        self.write_meta(path, meta)
+        log.debug("%s %s (%s bytes)", url, RESUMED if resumed else DOWNLOADED, size)
+        return DownloadResult(url, path, RESUMED if resumed else DOWNLOADED, size)
+
+    def fetch_all(self, urls: Iterable[str]) -> List[DownloadResult]:
+        """
+        Download URLs to the mirror in parallel
+        :param urls:
+        :return: DownloadResults in the order of urls
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) < 2 or self.workers == 1:
+            return [self.fetch(url) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            return list(executor.map(self.fetch, urls))
+
+    def download(self, urls: Iterable[str], output_directory: str) -> List[DownloadResult]:
+        """
+        Download URLs in parallel and copy changed files from the mirror to the directory
+        :param urls:
+        :param output_directory:
+        :return: DownloadResults with paths in the output directory
+        """
+        results = []
+        for result in self.fetch_all(urls):
+            target = os.path.join(output_directory, os.path.basename(result.path))
+            if result.status != NOT_MODIFIED or not os.path.exists(target):
+                os.makedirs(output_directory or ".", exist_ok=True)
+                shutil.copyfile(result.path, target)
+            results.append(result._replace(path=target))
+        log.info("%s files downloaded to %s, %s of them not modified", len(results),
+                 output_directory, sum(result.status == NOT_MODIFIED for result in results))
+        return results
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    """
+    Default downloader, shared by all callers to reuse its connections
+    :return: Downloader
+    """
+    global _downloader  # pylint: disable=W0603
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
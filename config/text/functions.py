@@ -5,76 +5,292 @@
 Common functions for text files
 """
 
+import io
+import re
+import shutil
 import time
 from datetime import timedelta
 import os
-from typing import List
-
-import requests
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Iterable, Iterator, List, NamedTuple, \
+    Optional, Union
 
 from config import log, SEPARATOR
+from config.metrics import metrics
 from config.text import EXPORT_DIRECTORY_PATH_LOCAL, root_directory
+from config.text.cache import DatasetCache
+from config.text.downloader import get_downloader
+
 
+class WrittenFile(NamedTuple):
+    """Result of writing a text file"""
+    path: str
+    lines: int
+    size: int
 
-def save_to_file(output_file_path, elements) -> None:
-    """Save list of str to text file"""
+
+def save_to_file(output_file_path, elements: Iterable[str],
+                 buffer_size: int = 1024 * 1024) -> WrittenFile:
+    """
+    Save list (or any iterable) of str to text file
+    Lines are written in large chunks to a temporary file next to the target,
+    which is synced to disk and then atomically renamed into place,
+    so an interrupted export never leaves a half-written file
+    :param output_file_path:
+    :param elements: iterable of lines
+    :param buffer_size: number of characters collected before each write
+    :return: WrittenFile with the number of lines and bytes
+    """
     os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    with open(output_file_path, "w+", encoding="utf-8") as file:
-        file.write("\n".join(elements))
-    file.close()
-    log.info("%s items exported to %s", len(elements), output_file_path.replace(r"\\", '\\'))
+    temp_file_path = f"{output_file_path}.{uuid.uuid4().hex}.tmp"
+    lines = 0
+    try:
+        with open(temp_file_path, "x", encoding="utf-8") as file:
+            buffer, buffered = [], 0
+            for lines, element in enumerate(elements, 1):
+                line = element if lines == 1 else "\n" + element
+                buffer.append(line)
+                buffered += len(line)
+                if buffered >= buffer_size:
+                    file.write("".join(buffer))
+                    buffer, buffered = [], 0
+            file.write("".join(buffer))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file_path, output_file_path)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+
+    result = WrittenFile(output_file_path, lines, os.path.getsize(output_file_path))
+    log.info("%s items (%s bytes) exported to %s",
+             result.lines, result.size, output_file_path.replace(r"\\", '\\'))
+    return result
+
+
+def export_model_to_file(exporter, export_model, output_directory: str,
+                         context: Optional[Callable[[], ContextManager]] = None) -> WrittenFile:
+    """
+    Export one model to its text file
+    Suitable for running in a separate thread or process
+    :param exporter: function returning model's lines
+    :param export_model:
+    :param output_directory:
+    :param context: factory of a context (db connection, app context)
+        required by exporter in this worker
+    :return: WrittenFile
+    """
+    with context() if context else nullcontext(), \
+            metrics.stage(export_model.__name__) as stage:
+        result = save_to_file(export_model.export_file_path(output_directory), exporter(export_model))
+        stage.rows = result.lines
+        return result
 
 
-def convert_db_to_txt(export_models: list, exporter, output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL):
+def convert_db_to_txt(export_models: list, exporter, output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL,
+                      workers: int = 1, use_processes: bool = False,
+                      context: Optional[Callable[[], ContextManager]] = None,
+                      initializer: Optional[Callable[[], None]] = None,
+                      run_name: str = "db_to_txt"):
     """
 
     :param export_models:
     :param exporter:
     :param output_directory:
+    :param workers: number of models exported at the same time
+    :param use_processes: use process pool instead of thread pool (for CPU-bound exporters)
+    :param context: factory of a context for each worker,
+        so that every worker has its own db session or connection
+    :param initializer: function called in each worker process before its first export
+    :param run_name: name of the run in metrics,
+        stages of models exported in separate processes are not recorded
     :return:
     """
 
     log.info("Starting db export")
     start_time = time.monotonic()
+    with metrics.run(run_name) as run:
+        run.rows = export_models_to_files(
+            export_models, exporter, output_directory, workers, use_processes, context, initializer)
 
-    for index, export_model in enumerate(export_models, 1):
-        log.info("Starting %s export (%s/%s)", export_model.__name__, index, len(export_models))
-        elements = exporter(export_model)
-        save_to_file(export_model.export_file_path(output_directory), elements)
-        log.info("Ending %s export\n", export_model.__name__)
-
-    log.info("ELAPSED TIME IN MINUTES: %s\n", timedelta(minutes=time.monotonic() - start_time))
+    log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
     log.info("Ending db export\n")
 
 
+def export_models_to_files(export_models: list, exporter, output_directory: str,
+                           workers: int, use_processes: bool,
+                           context: Optional[Callable[[], ContextManager]],
+                           initializer: Optional[Callable[[], None]] = None) -> int:
+    """
+    Export models in order of their __index_sort_export__
+    See convert_db_to_txt for parameters
+    :return: total number of exported lines
+    """
+    export_models = [model for _, model in sorted(
+        enumerate(export_models),
+        key=lambda item: getattr(item[1], "__index_sort_export__", item[0]))]
+    total = 0
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer) \
+            if use_processes else ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            futures = [executor.submit(
+                export_model_to_file, exporter, export_model, output_directory, context)
+                for export_model in export_models]
+            for index, (export_model, future) in enumerate(zip(export_models, futures), 1):
+                result = future.result()
+                total += result.lines
+                log.info("Ending %s export (%s/%s) - %s item(s), %s bytes\n",
+                         export_model.__name__, index, len(export_models),
+                         result.lines, result.size)
+    else:
+        for index, export_model in enumerate(export_models, 1):
+            log.info("Starting %s export (%s/%s)", export_model.__name__, index, len(export_models))
+            total += export_model_to_file(exporter, export_model, output_directory).lines
+            log.info("Ending %s export\n", export_model.__name__)
+    return total
+
+
+def iter_text_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Join text chunks and split them into lines by the newline symbol
+    :param chunks: Iterable of text pieces of any size
+    :return: Iterator of lines without the trailing newline symbol
+    """
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def parse_dictionary_lines(lines: Iterable[str], separator: str = SEPARATOR) -> Iterator[List[str]]:
+    """
+    Split non-empty lines into lists of line's elements
+    :param lines:
+    :param separator: separation symbol, '@' by default
+    :return: iterator of lists of line's elements
+    """
+    return (line.strip().split(separator) for line in lines if line)
+
+
+def read_dictionary_file(url: str, model_name: str,
+                         separator: str = SEPARATOR,
+                         chunk_size: int = 64 * 1024) -> Iterator[List[str]]:
+    """
+    Lazily read a local text file or a text file from the Github
+        and yield each line's elements as a list
+    Remote files are read from their copy in the download mirror.
+    Only one line is kept in memory at a time
+    :param url:
+    :param model_name:
+    :param separator: separation symbol, '@' by default
+    :param chunk_size: size of file chunks read at once
+    :return: iterator of lists of line's elements
+    """
+
+    log.debug("Start to get '%s' content", model_name)
+
+    with open(local_file_path(url), 'r', encoding="utf-8") as file:
+        yield from parse_dictionary_lines(iter_text_lines(
+            iter(lambda: file.read(chunk_size), "")), separator)
+
+    log.debug("Finish to get '%s' content\n", model_name)
+
+
 def download_dictionary_file(url: str, model_name: str,
-                             separator: str = SEPARATOR) -> List[List[str]]:
+                             separator: str = SEPARATOR,
+                             eager: bool = True) -> Union[List[List[str]], Iterator[List[str]]]:
     """
     Convert text file downloaded from the Github to the python list
         where each item is a list with line's elements
     :param url:
     :param model_name:
     :param separator: separation symbol, '@' by default
+    :param eager: If False, return a lazy iterator instead of a list
+    :return: prepared python list (or iterator)
+    """
+    rows = read_dictionary_file(url=url, model_name=model_name, separator=separator)
+    return list(rows) if eager else rows
+
+
+def load_dictionary_file(url: str, model_name: str,
+                         separator: str = SEPARATOR,
+                         cache: Optional[DatasetCache] = None) -> List[List[str]]:
+    """
+    Get parsed text file content, using the dataset cache if it is provided
+    The file is read as raw bytes and its hash is checked in the cache first,
+    so unchanged files are not parsed again
+    :param url:
+    :param model_name:
+    :param separator: separation symbol, '@' by default
+    :param cache: DatasetCache object or None to disable caching
     :return: prepared python list
     """
+    if cache is None:
+        return download_dictionary_file(url=url, model_name=model_name, separator=separator)
 
-    log.debug("Start to get '%s' content", model_name)
+    with open(local_file_path(url), "rb") as file:
+        content = file.read()
 
-    if str(url).startswith("http"):
-        lines = requests.get(url).text.split("\n")
-    else:
-        file = open(url, 'r', encoding="utf-8")
-        lines = file.read().split("\n")
+    key = cache.key(content, separator)
+    rows = cache.get(key)
+    if rows is not None:
+        log.debug("'%s' content loaded from cache", model_name)
+        return rows
 
-    log.debug("Finish to get '%s' content\n", model_name)
-    return [file_line.strip().split(separator) for file_line in lines if file_line]
+    text = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8").read()
+    rows = list(parse_dictionary_lines(text.split("\n"), separator))
+    cache.put(key, rows)
+    return rows
+
+
+def is_remote(url: str) -> bool:
+    return str(url).startswith("http")
+
+
+def local_file_path(url: str) -> str:
+    """
+    Download a remote file to the mirror if it is not there or has changed
+    :param url: URL or local path
+    :return: Local path of the file
+    """
+    return get_downloader().fetch(url).path if is_remote(url) else url
+
+
+def prefetch_files(urls: Iterable[str]) -> None:
+    """
+    Download remote files to the mirror in parallel before they are read one by one
+    :param urls: URLs or local paths, the latter are skipped
+    :return: None
+    """
+    remote_urls = [url for url in urls if is_remote(url)]
+    if remote_urls:
+        get_downloader().fetch_all(remote_urls)
+
+
+def download_files(sources: Iterable[str], output_directory: str = root_directory) -> None:
+    """
+    Download files in parallel, only changed ones are transferred again
+    :param sources: URLs
+    :param output_directory:
+    :return: None
+    """
+    get_downloader().download(sources, output_directory)
 
 
 def download_file(source, output_directory: str = root_directory, alias_name: str = None):
-    import urllib.request
-    import re
     filename = alias_name if alias_name else re.search(r"[ \w-]+\.\w+$", source)[0]
-    urllib.request.urlretrieve(source, f"{output_directory}{filename}")
+    result = get_downloader().fetch(source)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    shutil.copyfile(result.path, f"{output_directory or ''}{filename}")
 
 
 if __name__ == "__main__":
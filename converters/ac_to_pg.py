@@ -2,7 +2,8 @@
 """"Module for uploading data from AC database to PG database"""
 from typing import List
 
-from config import DEFAULT_LANGUAGE, SEPARATOR
+from config import log, DEFAULT_LANGUAGE, SEPARATOR
+from config.metrics import metrics
 from config.access import session, engine
 from config.access.model_export import IOAuthor, IOEvent, IODefinition, IOSyllable, IOSetting, \
     IOWord, IOWordSpell, IOType
@@ -10,13 +11,15 @@ from config.postgres.models import Author, Event, Key, Setting, Syllable, Type,
 from converters.txt_to_pg import generic_convert_to_pg
 
 
-def convert_model_to_txt(export_model) -> List[List[str]]:
+def convert_model_to_txt(export_model, ac_session=None) -> List[List[str]]:
     """
     This convert function suitable for all AC models
     :param export_model: Flask_sqlalchemy.model.DefaultMeta object
+    :param ac_session: Shared Access session, a new one is created (and closed) if None
     :return: List[str]
     """
-    ac_session = session()
+    own_session = ac_session is None
+    ac_session = session() if own_session else ac_session
     if getattr(export_model, "word_id", False) and getattr(export_model, "type", False):
         collection = ac_session.query(export_model).order_by(
             export_model.word_id.asc()).all()
@@ -27,26 +30,50 @@ def convert_model_to_txt(export_model) -> List[List[str]]:
         collection = ac_session.query(export_model).all()
 
     elements = list(dict.fromkeys([item.export() for item in collection]))
-    ac_session.close()
-    engine.dispose()
+    if own_session:
+        ac_session.close()
+        engine.dispose()
     return [item.strip().split(SEPARATOR) for item in elements]
 
 
 def get_txt_dataset(language: str):
-    return {
-        Author.__name__: (convert_model_to_txt(IOAuthor),),
-        Event.__name__: (convert_model_to_txt(IOEvent),),
-        Key.__name__: (convert_model_to_txt(IODefinition), language,),
-        Setting.__name__: (convert_model_to_txt(IOSetting),),
-        Syllable.__name__: (convert_model_to_txt(IOSyllable),),
-        Type.__name__: (convert_model_to_txt(IOType),),
-        Word.__name__: (convert_model_to_txt(IOWord), convert_model_to_txt(IOWordSpell),),
-        Definition.__name__: (convert_model_to_txt(IODefinition), language), }
+    """
+    Read each Access table once over one shared session
+    and give the same parsed rows to every converter that needs them
+    :param language:
+    :return:
+    """
+    ac_session = session()
+    extracted = {}
+
+    def extract(export_model) -> List[List[str]]:
+        if export_model not in extracted:
+            log.info("Extract %s data from Access", export_model.sort_name)
+            with metrics.stage(export_model.sort_name) as stage:
+                extracted[export_model] = convert_model_to_txt(export_model, ac_session)
+                stage.rows = len(extracted[export_model])
+        return extracted[export_model]
+
+    try:
+        return {
+            Author.__name__: (extract(IOAuthor),),
+            Event.__name__: (extract(IOEvent),),
+            Key.__name__: (extract(IODefinition), language,),
+            Setting.__name__: (extract(IOSetting),),
+            Syllable.__name__: (extract(IOSyllable),),
+            Type.__name__: (extract(IOType),),
+            Word.__name__: (extract(IOWord), extract(IOWordSpell),),
+            Definition.__name__: (extract(IODefinition), language), }
+    finally:
+        ac_session.close()
+        engine.dispose()
 
 
 def convert_ac_to_pg() -> None:
-    dataset = get_txt_dataset(DEFAULT_LANGUAGE)
-    generic_convert_to_pg(dataset=dataset)
+    with metrics.run("ac_to_pg"):
+        with metrics.stage("extract"):
+            dataset = get_txt_dataset(DEFAULT_LANGUAGE)
+        generic_convert_to_pg(dataset=dataset)
 
 
 if __name__ == "__main__":
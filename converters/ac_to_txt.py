@@ -41,12 +41,14 @@ def export_ac_model_to_list_of_str(export_model) -> List[str]:
     return elements
 
 
-def convert_ac_to_txt(output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL):
+def convert_ac_to_txt(output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL,
+                      workers: int = 1, use_processes: bool = False):
     """A wrapper for converting an Access database into text files"""
     convert_db_to_txt(
         export_models=export_models_ac,
         exporter=export_ac_model_to_list_of_str,
-        output_directory=output_directory)
+        output_directory=output_directory,
+        workers=workers, use_processes=use_processes, run_name="ac_to_txt")
 
 
 if __name__ == "__main__":
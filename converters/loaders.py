@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Module for bulk loading plain rows into database tables
+
+Converters return TableRows tuples (model instances are still accepted).
+The loader is chosen by the dialect of the target connection:
+PostgreSQL gets 'COPY ... FROM STDIN', SQLite gets the driver's executemany,
+everything else gets Core executemany
+"""
+
+import io
+import json
+from datetime import date, datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import inspect
+
+from config import log
+from config.metrics import round_trips
+
+
+class TableRows(NamedTuple):
+    """Plain table rows: column names and an iterable of value tuples"""
+    columns: Tuple[str, ...]
+    rows: Iterable[tuple]
+
+
+def chunks(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Split any iterable into lists of the specified size
+    :param items: Iterable to split
+    :param size: Maximum length of one chunk
+    :return: Iterator of lists
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def rows_from_objects(objects: Sequence) -> TableRows:
+    """
+    Convert model instances to plain table rows
+    Only columns which were explicitly set in the first object are used
+    :param objects: List of model instances of the same class
+    :return: TableRows
+    """
+    if not objects:
+        return TableRows((), [])
+
+    column_attrs = [
+        attr for attr in inspect(type(objects[0])).column_attrs
+        if attr.key in objects[0].__dict__]
+    columns = tuple(attr.columns[0].name for attr in column_attrs)
+    keys = [attr.key for attr in column_attrs]
+    return TableRows(columns, (tuple(getattr(obj, key) for key in keys) for obj in objects))
+
+
+def objects_from_rows(model, table_rows: TableRows) -> list:
+    """
+    Build model instances from plain table rows, for callers which need ORM objects
+    :param model: Model class of the table
+    :param table_rows: TableRows with the table's column names
+    :return: List of model instances
+    """
+    keys_by_column = {attr.columns[0].name: attr.key for attr in inspect(model).column_attrs}
+    keys = [keys_by_column[column] for column in table_rows.columns]
+    return [model(**dict(zip(keys, row))) for row in table_rows.rows]
+
+
+class RowLoader:
+    """
+    Default loader - sends rows to the table with Core executemany INSERTs
+    """
+    batch_size = 10000
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def load(self, table, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        """
+        Send all rows to the table in batches
+        :param table: sqlalchemy.Table
+        :param columns: Names of the table columns in rows' order
+        :param rows: Iterable of value tuples
+        :return: Number of loaded rows
+        """
+        total = 0
+        for batch in chunks(rows, self.batch_size):
+            self.send_batch(table, tuple(columns), batch)
+            total += len(batch)
+            log.debug("%s rows sent to '%s'", total, table.name)
+        return total
+
+    def send_batch(self, table, columns: Tuple[str, ...], batch: List[tuple]) -> None:
+        """
+        :param table:
+        :param columns:
+        :param batch:
+        :return: None
+        """
+        self.connection.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+
+
+def scalar_defaults(table, columns: Tuple[str, ...]) -> List[tuple]:
+    """
+    Scalar column defaults (like 'created') of the columns missing in rows,
+    for loaders which bypass Core and so its client-side defaults
+    :param table:
+    :param columns: Names of the columns present in rows
+    :return: List of (column name, value)
+    """
+    return [
+        (column.name, column.default.arg) for column in table.columns
+        if column.name not in columns
+        and column.default is not None and column.default.is_scalar]
+
+
+class CopyLoader(RowLoader):
+    """
+    PostgreSQL loader - streams rows to the server with COPY FROM STDIN
+    Scalar column defaults (like 'created') are added to the rows explicitly
+    because COPY does not know about client-side defaults
+    """
+
+    @staticmethod
+    def copy_value(value) -> str:
+        """
+        Present a python value as a quoted CSV field (NULL as an empty unquoted one)
+        :param value:
+        :return: str
+        """
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False)
+        elif isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        return '"' + value.replace('"', '""') + '"'
+
+    def send_batch(self, table, columns: Tuple[str, ...], batch: List[tuple]) -> None:
+        defaults = scalar_defaults(table, columns)
+        default_values = tuple(value for _, value in defaults)
+
+        preparer = self.connection.dialect.identifier_preparer
+        column_names = ", ".join(
+            preparer.quote(name) for name in columns + tuple(name for name, _ in defaults))
+        statement = f"COPY {preparer.format_table(table)} ({column_names}) " \
+                    f"FROM STDIN WITH (FORMAT csv)"
+
+        buffer = io.StringIO()
+        buffer.writelines(
+            ",".join(self.copy_value(value) for value in row + default_values) + "\n"
+            for row in batch)
+        buffer.seek(0)
+
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+            # COPY bypasses engine events, so it is counted here
+            round_trips.add()
+        finally:
+            cursor.close()
+
+
+class SqliteLoader(RowLoader):
+    """
+    SQLite loader - sends rows with the driver's executemany,
+    without statement compilation and a dict per row.
+    Values are prepared with the columns' bind processors (dates, JSON) as Core does
+    """
+    batch_size = 50000
+
+    def send_batch(self, table, columns: Tuple[str, ...], batch: List[tuple]) -> None:
+        defaults = scalar_defaults(table, columns)
+        all_columns = columns + tuple(name for name, _ in defaults)
+        dialect = self.connection.dialect
+        processors = [
+            table.c[name].type.dialect_impl(dialect).bind_processor(dialect)
+            for name in all_columns]
+        default_values = tuple(
+            processor(value) if processor else value
+            for processor, (_, value) in zip(processors[len(columns):], defaults))
+        processors = list(enumerate(processors[:len(columns)]))
+        if any(processor for _, processor in processors):
+            batch = (tuple(
+                processor(row[index]) if processor else row[index]
+                for index, processor in processors) + default_values for row in batch)
+        elif default_values:
+            batch = (row + default_values for row in batch)
+
+        preparer = dialect.identifier_preparer
+        statement = f"INSERT INTO {preparer.format_table(table)} " \
+                    f"({', '.join(preparer.quote(name) for name in all_columns)}) " \
+                    f"VALUES ({', '.join('?' * len(all_columns))})"
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.executemany(statement, batch)
+            # The driver's executemany bypasses engine events, so it is counted here
+            round_trips.add()
+        finally:
+            cursor.close()
+
+
+loaders = {
+    "postgresql": CopyLoader,
+    "sqlite": SqliteLoader,
+}
+
+
+def get_loader(connection) -> RowLoader:
+    """
+    Select an appropriate loader for the connection's dialect
+    :param connection: sqlalchemy.engine.Connection
+    :return: RowLoader
+    """
+    return loaders.get(connection.dialect.name, RowLoader)(connection)
@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
 """"Module for uploading data from PG database to AC database"""
 import time
+from collections import defaultdict
 from datetime import timedelta
+from typing import Iterable, Iterator
+
+from loglan_db import db
 
 from config import log, SEPARATOR
+from config.metrics import metrics
 from config.access import MDB_FILE_PATH as AC_PATH, db_get_statistic, session
 
 from loglan_db.model_export import export_models_pg
+from converters.loaders import chunks
 from converters.pg_to_txt import export_pg_model_to_list_of_str
 from converters.txt_to_ac import db_backup_file, db_clear_content, db_compress_file
-from config.access.model_export import export_models_ac
+from config.access.model_export import export_models_ac, IOAuthor, IODefinition, \
+    IOEvent, IOSetting, IOSyllable, IOType, IOWord, IOWordSpell
+from config.postgres.models import Author, Definition, Event, Setting, Syllable, Type, Word, \
+    t_connect_authors, t_connect_words
 
 
 def get_data_from_schema():
@@ -33,7 +42,202 @@ def get_data_from_schema():
     log.info("Ending db export\n")
 
 
-def convert_pg_to_ac(db_path: str = AC_PATH) -> None:
+def unique_rows(rows: Iterable[dict], group: str = None) -> Iterator[dict]:
+    """
+    Skip duplicated rows (the same way export lines were deduplicated)
+    :param rows: Iterable of dicts ordered by the group key
+    :param group: Key of rows which duplicates share, if any
+    :return: Iterator[dict]
+    """
+    current_group, seen = None, set()
+    for row in rows:
+        if group and row[group] != current_group:
+            current_group, seen = row[group], set()
+        values = tuple(row.values())
+        if values in seen:
+            continue
+        seen.add(values)
+        yield row
+
+
+def map_authors(batch_size: int) -> Iterator[dict]:
+    """Author rows for IOAuthor"""
+    for abbreviation, full_name, notes in Author.query.with_entities(
+            Author.abbreviation, Author.full_name, Author.notes) \
+            .order_by(Author.id.asc()).yield_per(batch_size):
+        yield {
+            "abbreviation": abbreviation,
+            "full_name": full_name if full_name else None,
+            "notes": notes if notes else None, }
+
+
+def map_definitions(batch_size: int) -> Iterator[dict]:
+    """Definition rows for IODefinition"""
+    query = Definition.query.join(Word, Word.id == Definition.word_id).with_entities(
+        Word.id_old, Definition.position, Definition.usage, Definition.slots,
+        Definition.grammar_code, Definition.body, Definition.case_tags) \
+        .order_by(Definition.id.asc()).yield_per(batch_size)
+    yield from unique_rows({
+        "word_id": id_old,
+        "position": position,
+        "usage": usage if usage else None,
+        "grammar": f"{slots if slots else ''}{grammar_code if grammar_code else ''}" or None,
+        "body": body,
+        "main": None,
+        "case_tags": case_tags if case_tags else None,
+    } for id_old, position, usage, slots, grammar_code, body, case_tags in query)
+
+
+def map_events(batch_size: int) -> Iterator[dict]:
+    """Event rows for IOEvent"""
+    for event in Event.query.with_entities(
+            Event.id, Event.name, Event.date, Event.definition, Event.annotation, Event.suffix) \
+            .order_by(Event.id.asc()).yield_per(batch_size):
+        yield {
+            "id": event.id,
+            "name": event.name,
+            "date": event.date.strftime('%m/%d/%Y'),
+            "definition": event.definition,
+            "annotation": event.annotation if event.annotation else None,
+            "suffix": event.suffix if event.suffix else None, }
+
+
+def map_settings(batch_size: int) -> Iterator[dict]:
+    """Setting rows for IOSetting"""
+    for setting in Setting.query.with_entities(
+            Setting.date, Setting.db_version, Setting.last_word_id, Setting.db_release) \
+            .order_by(Setting.id.asc()).yield_per(batch_size):
+        yield {
+            "date": setting.date.replace(microsecond=0),
+            "db_version": setting.db_version,
+            "last_word_id": setting.last_word_id,
+            "db_release": setting.db_release, }
+
+
+def map_syllables(batch_size: int) -> Iterator[dict]:
+    """Syllable rows for IOSyllable"""
+    for name, syllable_type, allowed in Syllable.query.with_entities(
+            Syllable.name, Syllable.type, Syllable.allowed) \
+            .order_by(Syllable.id.asc()).yield_per(batch_size):
+        yield {"name": name, "type": syllable_type, "allowed": allowed, }
+
+
+def map_types(batch_size: int) -> Iterator[dict]:
+    """Type rows for IOType"""
+    for item in Type.query.with_entities(
+            Type.type, Type.type_x, Type.group, Type.parentable, Type.description) \
+            .order_by(Type.id.asc()).yield_per(batch_size):
+        yield {
+            "type": item.type,
+            "type_x": item.type_x,
+            "group": item.group if item.group else None,
+            "parentable": item.parentable,
+            "description": item.description if item.description else '', }
+
+
+def map_words(batch_size: int) -> Iterator[dict]:
+    """
+    Word rows for IOWord
+    Authors, complexes and affixes of all words are loaded with three queries
+    """
+    authors = defaultdict(list)
+    for word_id, abbreviation in db.session.query(
+            t_connect_authors.c.WID, Author.abbreviation) \
+            .join(Author, Author.id == t_connect_authors.c.AID):
+        authors[word_id].append(abbreviation)
+
+    def get_derivatives(type_filter) -> dict:
+        derivatives = defaultdict(list)
+        for parent_id, name in db.session.query(t_connect_words.c.parent_id, Word.name) \
+                .join(Word, Word.id == t_connect_words.c.child_id).join(Type) \
+                .filter(type_filter).order_by(Word.name.asc()):
+            derivatives[parent_id].append(name)
+        return derivatives
+
+    complexes = get_derivatives(Type.group == "Cpx")
+    affixes = get_derivatives(Type.type == "Afx")
+
+    query = Word.query.join(Type).with_entities(
+        Word.id, Word.id_old, Type.type, Type.type_x, Word.match, Word.year, Word.rank,
+        Word.notes, Word.origin, Word.origin_x, Word.TID_old) \
+        .order_by(Word.id_old.asc(), Word.name.asc()).yield_per(batch_size)
+
+    def get_row(word) -> dict:
+        notes = word.notes if word.notes else {}
+        source = f"{'/'.join(sorted(authors[word.id]))} {notes.get('author', str())}".strip()
+        year = f"{word.year.year} {notes.get('year', str())}".strip()
+        rank = f"{word.rank if word.rank else ''} {notes.get('rank', str())}".strip()
+        e_affixes = ' '.join(afx.replace("-", "") for afx in affixes[word.id]).strip()
+        return {
+            "word_id": word.id_old,
+            "type": word.type,
+            "type_x": word.type_x,
+            "affixes": e_affixes if e_affixes else None,
+            "match": word.match if word.match else None,
+            "authors": source if source else None,
+            "year": year if year else None,
+            "rank": rank if rank else None,
+            "origin": word.origin if word.origin else None,
+            "origin_x": word.origin_x if word.origin_x else None,
+            "used_in": ' | '.join(complexes[word.id]) or None,
+            "TID_old": word.TID_old if word.TID_old else None, }
+
+    yield from unique_rows((get_row(word) for word in query), group="word_id")
+
+
+def map_word_spells(batch_size: int) -> Iterator[dict]:
+    """WordSpell rows for IOWordSpell"""
+    query = Word.query.with_entities(
+        Word.id_old, Word.name, Word.event_start_id, Word.event_end_id) \
+        .order_by(Word.id_old.asc(), Word.name.asc()).yield_per(batch_size)
+    yield from unique_rows(({
+        "word_id": id_old,
+        "word": name,
+        "sort_a": name.lower(),
+        "sort_b": "".join("0" if symbol.isupper() else "5" for symbol in name),
+        "event_start_id": event_start_id,
+        "event_end_id": event_end_id if event_end_id else 9999,
+        "origin_x": None,
+    } for id_old, name, event_start_id, event_end_id in query), group="word_id")
+
+
+direct_mappers = {
+    IOAuthor: map_authors,
+    IODefinition: map_definitions,
+    IOEvent: map_events,
+    IOSetting: map_settings,
+    IOSyllable: map_syllables,
+    IOType: map_types,
+    IOWord: map_words,
+    IOWordSpell: map_word_spells,
+}
+
+
+def get_data_directly(batch_size: int = 5000):
+    """
+    Move data from db to Access without the text round-trip:
+    rows from the source queries are mapped column-to-column
+    and sent to Access in batches
+    :param batch_size: Number of rows fetched and inserted at once
+    :return:
+    """
+    log.info("Starting to export data from db")
+    ac_session = session()
+    for import_model in export_models_ac:
+        log.info("Starting %s export", import_model.sort_name)
+        with metrics.stage(import_model.sort_name) as stage:
+            total = 0
+            for batch in chunks(direct_mappers[import_model](batch_size), batch_size):
+                ac_session.bulk_insert_mappings(import_model, batch)
+                total += len(batch)
+            ac_session.commit()
+            stage.rows = total
+        log.info("Ending %s export - %s object(s)", import_model.sort_name, total)
+    ac_session.close()
+    log.info("Ending db export\n")
+
+
+def convert_pg_to_ac(db_path: str = AC_PATH, direct: bool = True) -> None:
     """
     Complete new db generation. It remove previous db with all data
     and fill the new one with data from txt files
@@ -47,25 +251,34 @@ def convert_pg_to_ac(db_path: str = AC_PATH) -> None:
     log.info("START DB CREATION")
     start_time = time.monotonic()
 
-    log.info("MILESTONE: Create backup for DB")
-    db_backup_file(db_path=db_path)
+    with metrics.run("pg_to_ac"):
+        log.info("MILESTONE: Create backup for DB")
+        with metrics.stage("backup"):
+            db_backup_file(db_path=db_path)
 
-    log.info("MILESTONE: Clear all existing tables in DB")
-    db_clear_content(db_path=db_path)
+        log.info("MILESTONE: Clear all existing tables in DB")
+        with metrics.stage("clear_content"):
+            db_clear_content(db_path=db_path)
 
-    log.info("MILESTONE: Fill tables in new DB")
-    get_data_from_schema()
+        log.info("MILESTONE: Fill tables in new DB")
+        with metrics.stage("fill_tables"):
+            if direct:
+                get_data_directly()
+            else:
+                get_data_from_schema()
 
-    log.info("MILESTONE: Delete backup")
-    db_backup_file(db_path=db_path, remove=True)
+        log.info("MILESTONE: Delete backup")
+        with metrics.stage("delete_backup"):
+            db_backup_file(db_path=db_path, remove=True)
 
-    log.info("MILESTONE: Compress DB")
-    db_compress_file(db_path=db_path)
+        log.info("MILESTONE: Compress DB")
+        with metrics.stage("compress"):
+            db_compress_file(db_path=db_path)
 
-    log.info("ELAPSED TIME IN MINUTES: %s\n",
-             timedelta(minutes=time.monotonic() - start_time))
+        log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
 
-    db_get_statistic()
+        with metrics.stage("statistic"):
+            db_get_statistic()
     log.info("FINISH DB CREATION")
 
 
@@ -5,7 +5,13 @@
 Module for uploading data from Postgres database to text files
 """
 
-from typing import List
+import hashlib
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from flask import current_app
+from loglan_db import app_lod, db
 
 from config import log
 from config.postgres.models import export_models_pg
@@ -33,12 +39,96 @@ def export_pg_model_to_list_of_str(export_model) -> List[str]:
     return elements
 
 
-def convert_pg_to_txt(output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL):
+def iter_pg_model_export(export_model, batch_size: int = 1000) -> Iterator[str]:
+    """
+    Streaming version of export_pg_model_to_list_of_str
+    Rows are read through a server-side cursor in batches of batch_size
+    and exported lines are yielded as soon as they are ready
+    :param export_model: Flask_sqlalchemy.model.DefaultMeta object
+    :param batch_size: Number of rows fetched from the server at once
+    :return: Iterator[str]
+    """
+    attr = getattr(export_model, "id_old", None)
+    if attr:
+        query = export_model.query.order_by(
+            export_model.id_old.asc(), export_model.name.asc())
+    else:
+        query = export_model.query.order_by(export_model.id.asc())
+
+    collection = query.execution_options(stream_results=True).yield_per(batch_size)
+    if attr:
+        # Duplicates have the same id_old and come one after another,
+        # so only lines of the current id_old group are remembered
+        lines = ((item.id_old, item.export()) for item in collection)
+    else:
+        lines = ((None, item.export()) for item in collection)
+
+    yield from unique_lines(lines)
+
+
+def unique_lines(lines: Iterable[Tuple[Any, str]]) -> Iterator[str]:
+    """
+    Skip duplicated lines keeping the first occurrence order
+    Lines are compared within a group, which is reset when the group changes.
+    Ungrouped lines (group None) are remembered as short digests
+    :param lines: Iterable of (group, line) tuples ordered by group
+    :return: Iterator[str]
+    """
+    current_group, seen = None, set()
+    for group, line in lines:
+        if group != current_group:
+            current_group, seen = group, set()
+        digest = hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        yield line
+
+
+def forget_parent_session() -> None:
+    """
+    Initializer of export worker processes
+    A forked worker process inherits the parent's session registry
+    (keyed by the same thread ident) with the parent's open connection.
+    The session is dropped without closing, so the parent's connection
+    is never used or terminated by the child
+    :return: None
+    """
+    db.session.registry.clear()
+
+
+@contextmanager
+def pg_worker_context(database_uri: str):
+    """
+    Separate application context with its own engine and session
+    for export workers (threads or processes)
+    :param database_uri:
+    :return:
+    """
+    class AppConfig:  # pylint: disable=too-few-public-methods
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    app = app_lod(AppConfig)
+    with app.app_context():
+        try:
+            yield
+        finally:
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+
+def convert_pg_to_txt(output_directory: str = EXPORT_DIRECTORY_PATH_LOCAL,
+                      streaming: bool = True, workers: int = 1, use_processes: bool = False):
     """A wrapper for converting a Postgres database into text files"""
+    context = partial(pg_worker_context, current_app.config["SQLALCHEMY_DATABASE_URI"]) \
+        if workers > 1 else None
     convert_db_to_txt(
         export_models=export_models_pg,
-        exporter=export_pg_model_to_list_of_str,
-        output_directory=output_directory)
+        exporter=iter_pg_model_export if streaming else export_pg_model_to_list_of_str,
+        output_directory=output_directory,
+        workers=workers, use_processes=use_processes, context=context,
+        initializer=forget_parent_session, run_name="pg_to_txt")
 
 
 if __name__ == "__main__":
@@ -9,10 +9,13 @@ import win32com.client
 from sqlalchemy import MetaData
 
 from config import log
+from config.metrics import metrics
 from config.access import MDB_FILE_PATH as AC_PATH, db_get_statistic, session, engine
 from config.text import IMPORT_DIRECTORY_PATH_LOCAL
-from config.text.functions import download_dictionary_file
+from config.text.cache import get_dataset_cache
+from config.text.functions import download_dictionary_file, load_dictionary_file, prefetch_files
 from config.access.model_export import export_models_ac
+from converters.loaders import chunks
 
 
 def db_backup_file(db_path: str, suffix: str = "backup", remove: bool = False):
@@ -56,7 +59,8 @@ def db_compress_file(db_path):
     os.rename(dst_db, db_path)
 
 
-def db_fill_tables(source_path: str, models: list = export_models_ac) -> None:
+def db_fill_tables(source_path: str, models: list = export_models_ac,
+                   batch_size: int = 10000) -> None:
     """
     Consecutively execute converters and send data to the database
     ! The execution order is important for at least the following data types:
@@ -65,21 +69,29 @@ def db_fill_tables(source_path: str, models: list = export_models_ac) -> None:
     and the conversion of words depends on existing types
     :param source_path:
     :param models:
+    :param batch_size: Number of text lines converted and sent at once
     :return:
     """
     log.info("Start to fill tables with dictionary data")
+    cache = get_dataset_cache()
+    prefetch_files(f"{source_path}{model.import_file_name}" for model in models)
     ac_session = session()
     for model in models:
         model_name = model.__name__
         url = f"{source_path}{model.import_file_name}"
-        data = download_dictionary_file(url, model_name)
+        data = load_dictionary_file(url, model_name, cache=cache) \
+            if cache else download_dictionary_file(url, model_name, eager=False)
         log.info("Start to process %s objects", model_name)
-        objects = [model(**model.import_(item)) for item in data]
-        log.info("Total number of %s objects - %s", model_name, len(objects))
         log.info("Add %s objects to Database", model_name)
-        ac_session.bulk_save_objects(objects)
-        log.debug("Commit Database changes")
-        ac_session.commit()
+        with metrics.stage(model_name) as stage:
+            total = 0
+            for items in chunks(data, batch_size):
+                ac_session.bulk_save_objects([model(**model.import_(item)) for item in items])
+                total += len(items)
+            log.info("Total number of %s objects - %s", model_name, total)
+            log.debug("Commit Database changes")
+            ac_session.commit()
+            stage.rows = total
         log.info("Finish to process %s objects\n", model_name)
     ac_session.close()
     log.info("Finish to fill tables with dictionary data\n")
@@ -99,25 +111,31 @@ def convert_txt_to_ac(db_path: str = AC_PATH, source_directory: str = IMPORT_DIR
     log.info("START DB CREATION")
     start_time = time.monotonic()
 
-    log.info("MILESTONE: Create backup for DB")
-    db_backup_file(db_path=db_path)
+    with metrics.run("txt_to_ac"):
+        log.info("MILESTONE: Create backup for DB")
+        with metrics.stage("backup"):
+            db_backup_file(db_path=db_path)
 
-    log.info("MILESTONE: Clear all existing tables in DB")
-    db_clear_content(db_path=db_path)
+        log.info("MILESTONE: Clear all existing tables in DB")
+        with metrics.stage("clear_content"):
+            db_clear_content(db_path=db_path)
 
-    log.info("MILESTONE: Fill tables in new DB")
-    db_fill_tables(source_path=source_directory)
+        log.info("MILESTONE: Fill tables in new DB")
+        with metrics.stage("fill_tables"):
+            db_fill_tables(source_path=source_directory)
 
-    log.info("MILESTONE: Delete backup")
-    db_backup_file(db_path=db_path, remove=True)
+        log.info("MILESTONE: Delete backup")
+        with metrics.stage("delete_backup"):
+            db_backup_file(db_path=db_path, remove=True)
 
-    log.info("MILESTONE: Compress DB")
-    db_compress_file(db_path=db_path)
+        log.info("MILESTONE: Compress DB")
+        with metrics.stage("compress"):
+            db_compress_file(db_path=db_path)
 
-    log.info("ELAPSED TIME IN MINUTES: %s\n",
-             timedelta(minutes=time.monotonic() - start_time))
+        log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
 
-    db_get_statistic()
+        with metrics.stage("statistic"):
+            db_get_statistic()
 
     log.info("FINISH DB CREATION")
 
@@ -2,53 +2,239 @@
 """Module for generating LOD dictionary database from txt files"""
 import time
 from datetime import timedelta
+from typing import Optional
 
 from loglan_db import db
 
 from config import log, DEFAULT_LANGUAGE
+from config.metrics import metrics
 from config.postgres.models import all_models_pg
 from config.text import IMPORT_DIRECTORY_PATH_LOCAL
+from config.text.cache import DatasetCache
 from converters import db_get_statistic
+from converters.txt_to_pg.txt_to_pg_functions_checkpoint import \
+    ImportCheckpoint, START_STAGE, db_drop_import_progress, import_options
 from converters.txt_to_pg.txt_to_pg_functions_fill import db_fill_tables, get_dataset_for_converters
 from converters.txt_to_pg.txt_to_pg_functions_link import db_link_tables
+from converters.txt_to_pg.txt_to_pg_functions_pipeline import db_fill_tables_pipelined
+from converters.txt_to_pg.txt_to_pg_functions_schema import \
+    db_create_deferred, db_create_tables, db_deferred_ddl
+from converters.txt_to_pg.txt_to_pg_functions_swap import StagingCheckError, \
+    db_check_readers, db_check_staging, db_prepare_staging, db_swap_schemas, schema_search_path
+from converters.txt_to_pg.txt_to_pg_functions_sync import db_sync_tables
 
 
-def generic_convert_to_pg(dataset: dict):
+def generic_convert_to_pg(dataset: dict, incremental: bool = False,
+                          deferred: bool = False, unlogged: bool = False, resume: bool = False):
     """
     Complete new db generation. It remove previous db with all data
     and fill the new one with data from txt files
 
     The data from the source text files is added in two stages -
-    first the data itself, and then the relationship between it
-
+    first the data itself, and then the relationship between it.
+    Indexes and constraints are built after that, if deferred
+
+    In incremental mode existing tables are kept and only
+    the difference with the dataset is applied in one transaction
+
+    In resume mode a full import records its progress
+    (see txt_to_pg_functions_checkpoint module) and a failed resumable
+    import of the same data is continued after the last completed stage
+
+    :param dataset:
+    :param incremental: Apply only the difference to existing tables
+    :param deferred: Bulk-load mode: build indexes and constraints after loading a full import,
+        a failed import leaves tables without them
+    :param unlogged: Load a full import into UNLOGGED tables (PostgreSQL, if deferred)
+    :param resume: Record the progress of a full import and continue
+        the previous failed one, if its inputs are not changed
     :return: None
     """
 
     log.info("START DB CREATION")
     start_time = time.monotonic()
 
-    log.info("MILESTONE: Drop all existing tables in DB")
-    db.drop_all()
-
-    log.info("MILESTONE: Create all new tables in DB")
-    db.create_all()
+    with metrics.run("txt_to_pg"):
+        if incremental:
+            log.info("MILESTONE: Create missing tables in DB")
+            with metrics.stage("create_all"):
+                db.create_all()
+
+            log.info("MILESTONE: Synchronize tables with new data")
+            with metrics.stage("sync_tables"):
+                db_sync_tables(dataset=dataset)
+        else:
+            checkpoint = ImportCheckpoint(
+                dataset, options=import_options(deferred, unlogged)) if resume else None
+            if checkpoint and checkpoint.load():
+                log.info("MILESTONE: Resume the previous import")
+                deferred_ddl = db_deferred_ddl(unlogged=unlogged) if deferred else []
+            else:
+                if checkpoint:
+                    checkpoint.reset()
+                else:
+                    db_drop_import_progress()
+                log.info("MILESTONE: Drop all existing tables in DB")
+                with metrics.stage("drop_all"):
+                    db.drop_all()
+
+                log.info("MILESTONE: Create all new tables in DB")
+                with metrics.stage("create_all"):
+                    deferred_ddl = db_create_tables(deferred=deferred, unlogged=unlogged)
+                    if checkpoint:
+                        checkpoint.record(START_STAGE)
+                        db.session.commit()
+
+            log.info("MILESTONE: Fill tables in new DB")
+            with metrics.stage("fill_tables"):
+                db_fill_tables(dataset=dataset, checkpoint=checkpoint)
+
+            log.info("MILESTONE: Link data between tables")
+            with metrics.stage("link_tables"):
+                db_link_tables(dataset=dataset, checkpoint=checkpoint)
+
+            if deferred_ddl and not (checkpoint and checkpoint.is_done("create_constraints")):
+                log.info("MILESTONE: Build indexes and constraints")
+                with metrics.stage("create_constraints"), db.engine.begin() as connection:
+                    total = db_create_deferred(deferred_ddl, connection)
+                    if checkpoint:
+                        checkpoint.record("create_constraints", total, connection)
+
+            if checkpoint:
+                db_drop_import_progress()
+
+        log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
+        with metrics.stage("statistic"):
+            db_get_statistic(all_models_pg)
+    log.info("FINISH DB CREATION\n")
 
-    log.info("MILESTONE: Fill tables in new DB")
 
-    db_fill_tables(dataset=dataset)
+def pipelined_convert_to_pg(source_directory: str, language: str = DEFAULT_LANGUAGE,
+                            writers: int = 4, deferred: bool = False,
+                            unlogged: bool = False, cache: Optional[DatasetCache] = None) -> None:
+    """
+    Complete new db generation, where parsing of text files,
+    conversion and filling of tables run at the same time
+    See txt_to_pg_functions_pipeline module for details
+
+    :param source_directory:
+    :param language:
+    :param writers: Number of parallel writer threads
+    :param deferred: Bulk-load mode: build indexes and constraints after loading
+    :param unlogged: Load into UNLOGGED tables (PostgreSQL, if deferred)
+    :param cache: DatasetCache for parsed files, the default one is used if None
+    :return: None
+    """
 
-    log.info("MILESTONE: Link data between tables")
-    db_link_tables(dataset=dataset)
+    log.info("START DB CREATION")
+    start_time = time.monotonic()
 
-    log.info("ELAPSED TIME IN MINUTES: %s\n",
-             timedelta(minutes=time.monotonic() - start_time))
-    db_get_statistic(all_models_pg)
+    with metrics.run("txt_to_pg"):
+        db_drop_import_progress()
+        log.info("MILESTONE: Drop all existing tables in DB")
+        with metrics.stage("drop_all"):
+            db.drop_all()
+
+        log.info("MILESTONE: Create all new tables in DB")
+        with metrics.stage("create_all"):
+            deferred_ddl = db_create_tables(deferred=deferred, unlogged=unlogged)
+
+        log.info("MILESTONE: Parse files and fill tables in new DB")
+        with metrics.stage("fill_tables"):
+            dataset = db_fill_tables_pipelined(
+                source_path=source_directory, language=language, writers=writers, cache=cache)
+
+        log.info("MILESTONE: Link data between tables")
+        with metrics.stage("link_tables"):
+            db_link_tables(dataset=dataset)
+
+        if deferred_ddl:
+            log.info("MILESTONE: Build indexes and constraints")
+            with metrics.stage("create_constraints"):
+                db_create_deferred(deferred_ddl)
+
+        log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
+        with metrics.stage("statistic"):
+            db_get_statistic(all_models_pg)
     log.info("FINISH DB CREATION\n")
 
 
-def convert_txt_to_pg(source_directory: str = IMPORT_DIRECTORY_PATH_LOCAL) -> None:
+def staged_convert_to_pg(source_directory: str, pipelined: bool = True, deferred: bool = False,
+                         unlogged: bool = False, resume: bool = False) -> None:
+    """
+    Complete new db generation in the staging schema (PostgreSQL),
+    which replaces the live schema only if it passes the checks
+    See txt_to_pg_functions_swap module for details
+
+    :param source_directory:
+    :param pipelined: Overlap parsing, conversion and DB writes
+    :param deferred: Bulk-load mode: build indexes and constraints after loading
+    :param unlogged: Load into UNLOGGED tables (if deferred)
+    :param resume: Continue the previous failed import in the staging schema
+    :return: None
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name != "postgresql":
+        raise StagingCheckError(
+            f"The staged import needs PostgreSQL schemas, {dialect_name} is not supported")
+    db_check_readers()
+
+    with metrics.run("txt_to_pg_staged"):
+        with metrics.stage("prepare_staging"):
+            db_prepare_staging(keep=resume)
+
+        with schema_search_path():
+            if pipelined and not resume:
+                pipelined_convert_to_pg(
+                    source_directory=source_directory, language=DEFAULT_LANGUAGE,
+                    deferred=deferred, unlogged=unlogged)
+            else:
+                dataset = get_dataset_for_converters(
+                    source_path=source_directory, language=DEFAULT_LANGUAGE)
+                generic_convert_to_pg(
+                    dataset=dataset, deferred=deferred, unlogged=unlogged, resume=resume)
+
+        log.info("MILESTONE: Check the staging schema")
+        with metrics.stage("check_staging"):
+            problems = db_check_staging()
+        if problems:
+            raise StagingCheckError(f"The staging schema is not swapped: {'; '.join(problems)}")
+
+        log.info("MILESTONE: Swap the staging schema with the live one")
+        with metrics.stage("swap_schemas"):
+            db_swap_schemas()
+
+
+def convert_txt_to_pg(source_directory: str = IMPORT_DIRECTORY_PATH_LOCAL,
+                      incremental: bool = False, pipelined: bool = True,
+                      deferred: bool = False, unlogged: bool = False,
+                      resume: bool = False, staged: bool = False) -> None:
+    """
+    :param source_directory:
+    :param incremental: Apply only the difference to existing tables
+    :param pipelined: Overlap parsing, conversion and DB writes of a full import
+    :param deferred: Bulk-load mode: build indexes and constraints after loading a full import,
+        a failed import leaves tables without them
+    :param unlogged: Load a full import into UNLOGGED tables (PostgreSQL, if deferred)
+    :param resume: Record the progress of a full import and continue
+        the previous failed one (not pipelined)
+    :param staged: Build a full import in the staging schema and swap it with the live one
+    :return: None
+    """
+    if staged and not incremental:
+        staged_convert_to_pg(
+            source_directory=source_directory, pipelined=pipelined,
+            deferred=deferred, unlogged=unlogged, resume=resume)
+        return
+    if pipelined and not incremental and not resume:
+        pipelined_convert_to_pg(
+            source_directory=source_directory, language=DEFAULT_LANGUAGE,
+            deferred=deferred, unlogged=unlogged)
+        return
     dataset = get_dataset_for_converters(source_path=source_directory, language=DEFAULT_LANGUAGE)
-    generic_convert_to_pg(dataset=dataset)
+    generic_convert_to_pg(
+        dataset=dataset, incremental=incremental, deferred=deferred,
+        unlogged=unlogged, resume=resume)
 
 
 if __name__ == "__main__":
@@ -1,186 +1,172 @@
 # -*- coding: utf-8 -*-
 """
 Module for converting data from text files to a database
+
+Converters return plain TableRows (table column names and value tuples),
+which are sent to the database with Core, without ORM objects.
+If model instances are needed, use objects_from_rows,
+for example objects_from_rows(Author, converter_authors(authors))
 """
 
 import ast
 import re
+from collections import defaultdict
 from datetime import datetime
 from typing import List
 
 from config import log
-from config.postgres.models import Author, Event, Key, Setting, Syllable, Type, Definition, Word
+from config.metrics import instrumented
+from config.postgres.models import Type, Word
+from converters.loaders import TableRows
+
+KEY_PATTERN = re.compile(r"(?<=\«)(.+?)(?=\»)")
 
 
-def converter_authors(authors: List[List[str]]) -> List[Author]:
+def keys_from_string(string: str) -> List[str]:
+    """
+    Extract all «key» words from the definition's body
+    :param string: Definition's body
+    :return: List of keys in order of appearance
     """
-    Convert authors' txt data to DB objects
+    return KEY_PATTERN.findall(string)
+
+
+@instrumented()
+def converter_authors(authors: List[List[str]]) -> TableRows:
+    """
+    Convert authors' txt data to table rows
     :param authors: List of authors received from a text file
         using function convert_file_to_list
-    :return: List of Author object(s)
+    :return: TableRows of 'authors' table
     """
-    return [Author(**{
-        "abbreviation": item[0],
-        "full_name": item[1],
-        "notes": item[2]})
-            for item in authors]
+    return TableRows(
+        ("abbreviation", "full_name", "notes"),
+        [(item[0], item[1], item[2]) for item in authors])
 
 
-def converter_events(events: List[List[str]]) -> List[Event]:
+@instrumented()
+def converter_events(events: List[List[str]]) -> TableRows:
     """
-    Convert events' data (dictionary versions) to DB objects
+    Convert events' data (dictionary versions) to table rows
     :param events: List of events received from a text file
         using function convert_file_to_list
-    :return: List of Event object(s)
+    :return: TableRows of 'events' table
     """
-    return [Event(**{
-        "id": int(item[0]),
-        "date": datetime.strptime(item[2], '%m/%d/%Y'),
-        "name": item[1],
-        "definition": item[3],
-        "annotation": item[4],
-        "suffix": item[5],
-    }) for item in events]
+    return TableRows(
+        ("id", "date", "name", "definition", "annotation", "suffix"),
+        [(int(item[0]), datetime.strptime(item[2], '%m/%d/%Y'),
+          item[1], item[3], item[4], item[5]) for item in events])
 
 
-def converter_settings(settings: List[List[str]]) -> List[Setting]:
+@instrumented()
+def converter_settings(settings: List[List[str]]) -> TableRows:
     """
-    Convert settings' data to DB objects
+    Convert settings' data to table rows
     :param settings: List of settings sets received from a text file
         using function convert_file_to_list
-    :return: List of Setting object(s)
+    :return: TableRows of 'settings' table
     """
-    return [Setting(**{
-        "date": datetime.strptime(item[0], '%d.%m.%Y %H:%M:%S'),
-        "db_version": int(item[1]),
-        "last_word_id": int(item[2]),
-        "db_release": item[3],
-    }) for item in settings]
+    return TableRows(
+        ("date", "db_version", "last_word_id", "db_release"),
+        [(datetime.strptime(item[0], '%d.%m.%Y %H:%M:%S'),
+          int(item[1]), int(item[2]), item[3]) for item in settings])
 
 
-def converter_syllables(syllables: List[List[str]]) -> List[Syllable]:
+@instrumented()
+def converter_syllables(syllables: List[List[str]]) -> TableRows:
     """
-    Convert syllables' data to DB objects
+    Convert syllables' data to table rows
     :param syllables: List of syllables received from a text file
         using function convert_file_to_list
-    :return: List of Syllable object(s)
+    :return: TableRows of 'syllables' table
     """
-    return [Syllable(**{
-        "name": item[0],
-        "type": item[1],
-        "allowed": ast.literal_eval(item[2]),
-    }) for item in syllables]
+    return TableRows(
+        ("name", "type", "allowed"),
+        [(item[0], item[1], ast.literal_eval(item[2])) for item in syllables])
 
 
-def converter_types(types: List[List[str]]) -> List[Type]:
+@instrumented()
+def converter_types(types: List[List[str]]) -> TableRows:
     """
-    Convert words types' data to DB objects
+    Convert words types' data to table rows
     :param types: List of words types received from a text file
         using function convert_file_to_list
-    :return: List of Type object(s)
+    :return: TableRows of 'types' table
+    """
+    return TableRows(
+        ("type", "type_x", "group", "parentable", "description"),
+        [(item[0], item[1], item[2], ast.literal_eval(item[3]), item[4]) for item in types])
+
+
+def split_notes(value: str) -> tuple:
     """
-    return [Type(**{
-        "type": item[0],
-        "type_x": item[1],
-        "group": item[2],
-        "parentable": ast.literal_eval(item[3]),
-        "description": item[4],
-    }) for item in types]
+    Split a field like '1975 (notes)' into the value and its notes
+    :param value: Field of a Words.txt line
+    :return: (value, notes or None)
+    """
+    parts = value.split(" ", 1)
+    return parts[0], parts[1] if len(parts) > 1 else None
 
 
-def converter_words(words: List[List[str]], spell: List[List[str]]) -> List[Word]:
+@instrumented()
+def converter_words(words: List[List[str]], spell: List[List[str]]) -> TableRows:
     """
-    Convert words' data to DB objects
+    Convert words' data to table rows
+    Each Words.txt line is parsed once into a compact record,
+    then every WordSpell line is joined with its record by id_old
     ! This process requires that Type objects were already added to DB
     :param words: List of words' data received from a text file
         using function convert_file_to_list
     :param spell: List of words versioning by events (see Event description)
         received from a text file using function convert_file_to_list
-    :return: List of Word object(s)
-    """
-
-    def get_year(str_date: str) -> dict:
-        date_year = str_date.split(" ", 1)
-        return {"year": datetime.strptime(date_year[0], "%Y").date(),
-                "notes": date_year[1] if len(date_year) > 1 else None}
-
-    def get_rank(str_rank: str) -> dict:
-        rank_data = str_rank.split(" ", 1)
-        return {"rank": rank_data[0],
-                "notes": rank_data[1] if len(rank_data) > 1 else None}
-
-    def get_author(str_author) -> dict:
-        author_data = str_author.split(" ", 1)
-        return {"author": author_data[0],
-                "notes": author_data[1] if len(author_data) > 1 else None}
-
-    def get_notes(item: list) -> dict:
-        str_notes = {}
-        author = get_author(item[5])["notes"]
-        year = get_year(item[6])["notes"]
-        rank = get_rank(item[7])["notes"]
-
-        if author is not None:
-            str_notes["author"] = author
-        if year is not None:
-            str_notes["year"] = year
-        if rank is not None:
-            str_notes["rank"] = rank
-
-        return str_notes if str_notes else None
-
-    types = dict((item.type, item.id) for item in Type.query.all())
-
-    dict_of_word_names_as_dict = {(index, int(item[0])): {
-        "name": item[1],
-        "id_old": int(item[0]),
-        "event_start_id": int(item[4]),
-        "event_end_id": int(item[5]) if int(item[5]) < 9999 else None
-    } for index, item in enumerate(spell)}
-
-    dict_of_word_data_as_dict = {int(item[0]): {
-        "authors": get_author(item[5])["author"],
-        "type_id": types[item[1]],
-        "origin": item[8],
-        "origin_x": item[9],
-        "id_old": int(item[0]),
-        "match": item[4],
-        "rank": get_rank(item[7])["rank"],
-        "year": get_year(item[6])["year"],
-        "TID_old": int(item[11]) if item[11] else None,
-        "notes": get_notes(item),
-    } for item in words}
-
-    dowdad = dict_of_word_data_as_dict
-    downad = dict_of_word_names_as_dict
-
-    words = [Word(**{
-        "name": downad[index]["name"],
-        "event_start_id": downad[index]["event_start_id"],
-        "event_end_id": downad[index]["event_end_id"],
-        "id_old": dowdad[index[1]]["id_old"],
-        "origin": dowdad[index[1]]["origin"],
-        "origin_x": dowdad[index[1]]["origin_x"],
-        "type_id": dowdad[index[1]]["type_id"],
-        "match": dowdad[index[1]]["match"],
-        "rank": dowdad[index[1]]["rank"],
-        "year": dowdad[index[1]]["year"],
-        "notes": dowdad[index[1]]["notes"],
-        "TID_old": dowdad[index[1]]["TID_old"]
-    }) for index in downad.keys()]
-
-    words.sort(key=lambda x: x.name)
-    return words
-
-
+    :return: TableRows of 'words' table sorted by name
+    """
+    types = dict(Type.query.with_entities(Type.type, Type.id).all())
+    years = {}
+
+    def get_year(str_year: str) -> tuple:
+        if str_year not in years:
+            year, notes = split_notes(str_year)
+            years[str_year] = (datetime.strptime(year, "%Y").date(), notes)
+        return years[str_year]
+
+    # id_old -> (origin, origin_x, type, match, rank, year, notes, TID_old)
+    records = {}
+    for item in words:
+        author_notes = split_notes(item[5])[1]
+        year, year_notes = get_year(item[6])
+        rank, rank_notes = split_notes(item[7])
+        notes = {name: value for name, value in (
+            ("author", author_notes), ("year", year_notes), ("rank", rank_notes))
+                 if value is not None}
+        records[int(item[0])] = (
+            item[8], item[9], types[item[1]], item[4], rank, year,
+            notes or None, int(item[11]) if item[11] else None)
+
+    # Stable order by name, as the words are stored in DB
+    rows = []
+    for index in sorted(range(len(spell)), key=lambda i: spell[i][1]):
+        item = spell[index]
+        id_old, event_end = int(item[0]), int(item[5])
+        rows.append((
+            item[1], int(item[4]), event_end if event_end < 9999 else None, id_old,
+        ) + records[id_old])
+
+    return TableRows((
+        "name", "event_start", "event_end", "id_old", "origin", "origin_x",
+        "type", "match", "rank", "year", "notes", "TID_old"), rows)
+
+
+@instrumented()
 def converter_definitions(
-        definitions: List[List[str]], language: str) -> List[Definition]:
+        definitions: List[List[str]], language: str) -> TableRows:
     """
-    Convert words definitions' data to DB objects
+    Convert words definitions' data to table rows
+    ! This process requires that Word objects were already added to DB
     :param definitions: List of definitions received from a text file
         using function convert_file_to_list
     :param language: Definitions' language
-    :return: List of Definition object(s)
+    :return: TableRows of 'definitions' table
     """
     def get_grammar(str_grammar: str) -> dict:
         slots = re.search(r"\d", str_grammar)
@@ -190,30 +176,33 @@ def converter_definitions(
             "slots": int(slots.group(0)) if slots else None,
             "code": code.group(0) if code else "", }
 
-    all_definitions = []
-    for item in definitions:
-        for word in Word.query.filter(Word.id_old == int(item[0])).all():
-            all_definitions.append(Definition(**{
-                "word_id": word.id,
-                "position": int(item[1]),
-                "usage": item[2],
-                "slots": get_grammar(item[3])["slots"],
-                "grammar_code": get_grammar(item[3])["code"],
-                "body": item[4],
-                "language": language,
-                "case_tags": item[6],
-            }))
-    return all_definitions
-
+    # One query for all words instead of one query per definition line
+    word_ids_by_id_old = defaultdict(list)
+    for id_old, word_id in Word.query.with_entities(Word.id_old, Word.id).all():
+        word_ids_by_id_old[id_old].append(word_id)
 
+    rows = []
+    for item in definitions:
+        grammar = get_grammar(item[3])
+        position = int(item[1])
+        rows.extend(
+            (word_id, position, item[2], grammar["slots"], grammar["code"],
+             item[4], language, item[6])
+            for word_id in word_ids_by_id_old.get(int(item[0]), []))
+    return TableRows((
+        "word_id", "position", "usage", "slots", "grammar_code",
+        "body", "language", "case_tags"), rows)
+
+
+@instrumented()
 def converter_keys(
-        definitions: List[List[str]], language: str) -> List[Key]:
+        definitions: List[List[str]], language: str) -> TableRows:
     """
-    Convert all unique keys received from words' definitions to DB objects
+    Convert all unique keys received from words' definitions to table rows
     :param definitions: List of definitions received from a text file
         using function convert_file_to_list
     :param language: Keys' language
-    :return: List with Key object(s)
+    :return: TableRows of 'keys' table
     """
     log.info("Start collecting dictionary keys")
 
@@ -226,10 +215,6 @@ def converter_keys(
         keys = ("id_old", "position", "usage", "grammar_code", "body", "case_tags", )
         return dict(zip(keys, wd_line))
 
-    def keys_from_string(string: str) -> List[str]:
-        key_pattern = r"(?<=\«)(.+?)(?=\»)"
-        return re.findall(key_pattern, string)
-
     all_keys = []
     without_keys_count = 0
 
@@ -250,7 +235,7 @@ def converter_keys(
         log.warning("Definitions without keys:\t%s", without_keys_count)
     log.info("Finish collecting dictionary keys\n")
 
-    return [Key(**{"word": key, "language": language, }) for key in unique_keys]
+    return TableRows(("word", "language"), [(key, language) for key in unique_keys])
 
 
 converters_pg = (
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Module for checkpoints of the full txt -> db import
+
+Each completed milestone and each filled or linked table is recorded
+in the 'import_progress' table with its row count and the hash of its input data.
+Records are written in the same transaction as the stage's data,
+so a recorded stage is always completely in the database.
+A resumed import skips recorded stages, but only if the inputs
+(hashes) and the filled tables (row counts) are the same as recorded,
+otherwise it starts from scratch.
+Progress is recorded only by resumable imports and the table is dropped
+after any successful full import, so it exists only after a failed one
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from loglan_db import db
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select
+
+from config import log
+from config.postgres.models import all_models_pg
+
+# Not a part of db.metadata, so it survives db.drop_all()
+progress_metadata = MetaData()
+
+t_import_progress = Table(
+    "import_progress", progress_metadata,
+    Column("stage", String(64), primary_key=True),
+    Column("rows", Integer),
+    Column("input_hash", String(64), nullable=False),
+    Column("finished", DateTime, nullable=False), )
+
+FILL_PREFIX = "fill:"
+START_STAGE = "create_all"
+
+
+def db_drop_import_progress() -> None:
+    """
+    Forget the progress of the previous import, if there is one
+    :return: None
+    """
+    t_import_progress.drop(db.engine, checkfirst=True)
+
+
+def import_options(deferred: bool, unlogged: bool) -> str:
+    """
+    :param deferred:
+    :param unlogged:
+    :return: Options of a full import for ImportCheckpoint
+    """
+    return f"deferred={deferred} unlogged={unlogged}"
+
+
+def data_hash(arguments: Iterable) -> str:
+    """
+    Hash of converter arguments: parsed text files (lists of lines' elements) and strings
+    :param arguments:
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    for argument in arguments:
+        if isinstance(argument, str):
+            digest.update(argument.encode("utf-8") + b"\x1e")
+            continue
+        for row in argument:
+            digest.update("\x1f".join(row).encode("utf-8") + b"\n")
+        digest.update(b"\x1d")
+    return digest.hexdigest()
+
+
+class ImportCheckpoint:
+    """
+    Progress of one full import of the dataset
+    """
+
+    def __init__(self, dataset: dict, options: str = ""):
+        """
+        :param dataset: Dataset for converters, see get_dataset_for_converters
+        :param options: Import options the tables are created with,
+            an import with other options is not resumed
+        """
+        self.table_hashes = {
+            f"{FILL_PREFIX}{model_name}": data_hash(arguments)
+            for model_name, arguments in dataset.items()}
+        self.dataset_hash = data_hash(sorted(self.table_hashes.values()) + [options])
+        self.done: Dict[str, Optional[int]] = {}
+
+    def input_hash(self, stage: str) -> str:
+        """
+        Tables are filled from their own files, other stages depend on the whole dataset
+        :param stage:
+        :return: hex digest
+        """
+        return self.table_hashes.get(stage, self.dataset_hash)
+
+    def is_done(self, stage: str) -> bool:
+        """
+        :param stage:
+        :return: True if the stage is completed by this or the resumed import
+        """
+        return stage in self.done
+
+    def reset(self) -> None:
+        """
+        Forget the previous progress, before a new import from scratch
+        :return: None
+        """
+        with db.engine.begin() as connection:
+            progress_metadata.create_all(connection)
+            connection.execute(t_import_progress.delete())
+        self.done = {}
+
+    def load(self) -> bool:
+        """
+        Read the progress of the previous import and check that it can be continued
+        :return: True if the import can be resumed
+        """
+        if not inspect(db.engine).has_table(t_import_progress.name):
+            log.info("There is no import progress to resume")
+            return False
+        records = db.session.execute(select(
+            t_import_progress.c.stage, t_import_progress.c.rows,
+            t_import_progress.c.input_hash)).fetchall()
+        db.session.commit()
+
+        if START_STAGE not in {stage for stage, _, _ in records}:
+            log.info("There is no import progress to resume")
+            return False
+
+        changed = [stage for stage, _, recorded_hash in records
+                   if recorded_hash != self.input_hash(stage)]
+        if changed:
+            log.warning("Input data changed since the checkpoint for: %s", ", ".join(changed))
+            return False
+
+        models = {model.__name__: model for model in all_models_pg}
+        for stage, rows, _ in records:
+            if not stage.startswith(FILL_PREFIX):
+                continue
+            table = models[stage[len(FILL_PREFIX):]].__table__
+            count = db.session.execute(select(func.count()).select_from(table)).scalar()
+            if count != rows:
+                log.warning("Table '%s' has %s rows instead of %s recorded", table.name, count, rows)
+                db.session.commit()
+                return False
+        db.session.commit()
+
+        self.done = {stage: rows for stage, rows, _ in records}
+        log.info("Import is resumed after stages: %s", ", ".join(self.done))
+        return True
+
+    def record(self, stage: str, rows: Optional[int] = None, connection=None) -> None:
+        """
+        Record the completed stage in the current transaction,
+        it is committed together with the stage's data
+        :param stage:
+        :param rows: Number of the stage's rows
+        :param connection: Connection of the stage's transaction, the session's one if None
+        :return: None
+        """
+        connection = connection if connection is not None else db.session.connection()
+        connection.execute(t_import_progress.insert().values(
+            stage=stage, rows=rows, input_hash=self.input_hash(stage),
+            finished=datetime.now()))
+        self.done[stage] = rows
@@ -3,58 +3,104 @@
 Module for adding dictionary data to the database
 """
 
+from typing import Optional
+
 from loglan_db import db
 
 from config import log
+from config.metrics import metrics
 from config.postgres.models import Author, Event, Key, Setting, Syllable, \
     Type, Definition, Word, WordSpell, all_models_pg
-from config.text.functions import download_dictionary_file
+from config.text.cache import DatasetCache, get_dataset_cache
+from config.text.functions import load_dictionary_file, prefetch_files
+from converters.loaders import TableRows, get_loader, rows_from_objects
 from converters.txt_to_pg.converters_txt_to_pg import converters_pg
+from converters.txt_to_pg.txt_to_pg_functions_checkpoint import FILL_PREFIX, ImportCheckpoint
 
 
-def get_txt_dataset(source_path: str):
+def get_txt_dataset(source_path: str, cache: Optional[DatasetCache] = None):
     """
     :param source_path:
+    :param cache: DatasetCache for parsed files, the default one is used if None
     :return:
     """
-    return {model.__name__: download_dictionary_file(
-            url=f"{source_path}{model.file_name}", model_name=model.__name__)
-            for model in all_models_pg if model.__load_from_file__}
+    cache = cache if cache else get_dataset_cache()
+    models = [model for model in all_models_pg if model.__load_from_file__]
+    prefetch_files(f"{source_path}{model.file_name}" for model in models)
+    return {model.__name__: load_dictionary_file(
+            url=f"{source_path}{model.file_name}", model_name=model.__name__, cache=cache)
+            for model in models}
+
 
+# Text files (by model name) needed by each converter, in converters' order
+converter_inputs = {
+    Author.__name__: (Author.__name__,),
+    Event.__name__: (Event.__name__,),
+    Key.__name__: (Definition.__name__,),
+    Setting.__name__: (Setting.__name__,),
+    Syllable.__name__: (Syllable.__name__,),
+    Type.__name__: (Type.__name__,),
+    Word.__name__: (Word.__name__, WordSpell.__name__),
+    Definition.__name__: (Definition.__name__,), }
 
-def get_dataset_for_converters(source_path: str, language: str) -> dict:
-    txt_dataset = get_txt_dataset(source_path)
-    return {
-        Author.__name__: (txt_dataset[Author.__name__],),
-        Event.__name__: (txt_dataset[Event.__name__],),
-        Key.__name__: (txt_dataset[Definition.__name__], language),
-        Setting.__name__: (txt_dataset[Setting.__name__],),
-        Syllable.__name__: (txt_dataset[Syllable.__name__],),
-        Type.__name__: (txt_dataset[Type.__name__],),
-        Word.__name__: (txt_dataset[Word.__name__], txt_dataset[WordSpell.__name__]),
-        Definition.__name__: (txt_dataset[Definition.__name__], language), }
+# Converters which also receive the dictionary language
+converters_with_language = (Key.__name__, Definition.__name__, )
 
 
-def db_fill_tables(dataset: dict, converters: tuple = converters_pg, ) -> None:
+def get_converter_arguments(model_name: str, txt_dataset: dict, language: str) -> tuple:
+    """
+    :param model_name: Name of the model to convert
+    :param txt_dataset: Parsed text files by model name
+    :param language:
+    :return: Arguments for the model's converter
+    """
+    arguments = tuple(txt_dataset[name] for name in converter_inputs[model_name])
+    return arguments + (language,) if model_name in converters_with_language else arguments
+
+
+def get_dataset_for_converters(source_path: str, language: str,
+                               cache: Optional[DatasetCache] = None) -> dict:
+    txt_dataset = get_txt_dataset(source_path, cache)
+    return {model_name: get_converter_arguments(model_name, txt_dataset, language)
+            for model_name in converter_inputs}
+
+
+def db_fill_tables(dataset: dict, converters: tuple = converters_pg,
+                   checkpoint: Optional[ImportCheckpoint] = None) -> None:
     """
         Consecutively execute converters and send data to the database
     ! The execution order is important for at least the following data types:
         Type -> Word -> Definition,
     because the conversion of definitions depends on existing words,
     and the conversion of words depends on existing types
+
+    Converters can return either model instances or plain TableRows,
+    both are sent to the database through the dialect's loader
     :param dataset:
     :param converters:
+    :param checkpoint: ImportCheckpoint, filled tables are recorded in it
+        with their data and skipped if they are already recorded
     :return:
     """
     log.info("Start to fill tables with dictionary data")
+    models = {model.__name__: model for model in all_models_pg}
     for converter, model_name, model_data in zip(converters, dataset.keys(), dataset.values()):
+        stage_name = f"{FILL_PREFIX}{model_name}"
+        if checkpoint and checkpoint.is_done(stage_name):
+            log.info("%s objects are already added, skipped", model_name)
+            continue
         log.info("Start to process %s objects", model_name)
-        objects = converter(*model_data)
-        log.info("Total number of %s objects - %s", model_name, len(objects))
-        log.info("Add %s objects to Database", model_name)
-        db.session.bulk_save_objects(objects)
-        log.debug("Commit Database changes")
-        db.session.commit()
+        with metrics.stage(model_name) as stage:
+            objects = converter(*model_data)
+            table_rows = objects if isinstance(objects, TableRows) else rows_from_objects(objects)
+            log.info("Add %s objects to Database", model_name)
+            stage.rows = total = get_loader(db.session.connection()).load(
+                models[model_name].__table__, table_rows.columns, table_rows.rows)
+            log.info("Total number of %s objects - %s", model_name, total)
+            if checkpoint:
+                checkpoint.record(stage_name, total)
+            log.debug("Commit Database changes")
+            db.session.commit()
         log.info("Finish to process %s objects\n", model_name)
 
     log.info("Finish to fill tables with dictionary data\n")
@@ -4,100 +4,120 @@
 Module for creating database relationships
 """
 
-from typing import List
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
 
 from loglan_db import db, app_lod
 
 from config import log
-from config.postgres.models import Author, Type, Definition, Word
+from config.metrics import instrumented
+from config.postgres.models import Author, Key, Type, Definition, Word, \
+    t_connect_authors, t_connect_keys, t_connect_words
+from converters.loaders import get_loader
+from converters.txt_to_pg.converters_txt_to_pg import keys_from_string
+from converters.txt_to_pg.txt_to_pg_functions_checkpoint import ImportCheckpoint
 
 
-def db_link_authors(words: List[List[str]]) -> None:
+def db_insert_links(table, columns: tuple, links: Iterable[tuple]) -> int:
     """
-    Create relations between words and their authors (WID <-> AID) in DB
-    These connections locate in 't_connect_authors' table
+    Send all relation rows to a connecting table with one bulk load
+    :param table: Connecting table, like t_connect_words
+    :param columns: Names of the table's columns in links' order
+    :param links: Iterable of tuples with the table's column values
+    :return: Number of inserted rows
+    """
+    return get_loader(db.session.connection()).load(table, columns, links)
 
+
+def get_author_links(words: List[List[str]]) -> dict:
+    """
+    Collect relations between words and their authors (AID, WID)
     :param words: List of words' data received from a text file
         using function convert_file_to_list
-    :return: None
+    :return: dict with (AID, WID) tuples as keys in order of appearance
     """
-    log.info("Start to link words with their authors")
-
-    all_authors = Author.query.all()
-    author_by_abbr = {author.abbreviation: author for author in all_authors}
+    author_id_by_abbr = dict(Author.query.with_entities(Author.abbreviation, Author.id).all())
 
     # Get a dictionary with a list of abbreviations of authors of each word by id_old
     dict_of_authors_data_as_dict = {
         int(word_data[0]): word_data[5].split(" ", 1)[0].split("/")
         for word_data in words}
 
-    for word in Word.query.all():
-        authors_abbreviations = dict_of_authors_data_as_dict[word.id_old]
-        word.add_authors([author_by_abbr[abbreviation] for abbreviation in authors_abbreviations])
-        log_text = f"{word.name} {' '*(26-len(word.name))}-> {'/'.join(authors_abbreviations)}"
-        log.debug(log_text)
-    db.session.commit()
-    log.info("Finish to link words with their authors")
+    links = {}
+    for word_id, id_old in Word.query.with_entities(Word.id, Word.id_old).all():
+        authors_abbreviations = dict_of_authors_data_as_dict[id_old]
+        links.update(dict.fromkeys(
+            (author_id_by_abbr[abbreviation], word_id)
+            for abbreviation in authors_abbreviations))
+    return links
 
 
-def db_link_complexes(words: List[List[str]]) -> None:
+def get_complex_links(words: List[List[str]]) -> dict:
     """
-    Create relations in DB between -
-        primitives and derivative complexes,
-        primitives and derivative small words,
-        small words and combinations based on them
+    Collect relations between words and their derivatives from 'Used In' field
     :param words: List of words' data received from a text file
         using function convert_file_to_list
-    :return: None
+    :return: dict with (parent_id, child_id) tuples as keys in order of appearance
     """
 
-    log.info("Start to create relations between primitives and their derivatives")
-
     def get_elements_from_str(set_as_str: str, separator: str = " | ") -> list:
         return [element.strip() for element in set_as_str.split(separator)]
 
-    all_words = Word.get_all()
-    all_word_names = [w.name for w in all_words]
+    word_ids_by_name = defaultdict(list)
+    word_ids_by_id_old = defaultdict(list)
+    for word_id, id_old, name in Word.query.with_entities(Word.id, Word.id_old, Word.name).all():
+        word_ids_by_name[name].append(word_id)
+        word_ids_by_id_old[id_old].append(word_id)
+
+    links = {}
     for item in words:
         if not item[10]:  # If 'Used In' field does not exist
             continue
 
         # On idea only one parent should always be here
-        # parents = Word.query.filter(Word.id_old == int(item[0])).all()
-        parents = [word for word in all_words if word.id_old == int(item[0])]  # LOCAL
-        if len(parents) > 1:
+        parent_ids = word_ids_by_id_old.get(int(item[0]), [])
+        if len(parent_ids) > 1:
             log.warning(
-                "The are %s for this word!\n%s",
-                len(parents), [parent.name for parent in parents])
-        for parent in parents:
-            child_names = get_elements_from_str(item[10])
-            # children = Word.query.filter(Word.name.in_(child_names)).order_by(Word.id.asc()).all()
-            children = [w for w in all_words if (w and (w.name in child_names))]  # LOCAL
-
-            children = [child for child in children if child]
-            # In case if any unspecified word exist in used_in list
-            [log.debug(parent, child) for child in child_names if child not in all_word_names]
-
-            parent.add_children(children)
-            log_text = f"{parent.name} {' ' * (26 - len(parent.name))}-> {child_names}"
-            log.debug(log_text)
-    db.session.commit()
-    log.info("Finish to create relations between primitives and their derivatives")
+                "The are %s words with id_old %s: %s",
+                len(parent_ids), item[0], parent_ids)
+
+        child_names = get_elements_from_str(item[10])
+        # In case if any unspecified word exist in used_in list
+        [log.debug("%s -> unknown child '%s'", item[0], child)
+         for child in child_names if child not in word_ids_by_name]
+        child_ids = [child_id for child in child_names
+                     for child_id in word_ids_by_name.get(child, [])]
+
+        for parent_id in parent_ids:
+            links.update(dict.fromkeys((parent_id, child_id) for child_id in child_ids))
+        log.debug("%s -> %s", item[0], child_names)
+    return links
 
 
-def db_link_affixes(words: List[List[str]]) -> None:
+def get_affix_links(words: List[List[str]]) -> Tuple[dict, int]:
     """
-    Create relations in DB between primitives and their affixes
+    Collect relations between primitives and their affixes
     :param words: List of words' data received from a text file
         using function convert_file_to_list
-    :return: None
+    :return: dict with (parent_id, child_id) tuples as keys in order of appearance
+        and the total number of found affixes
     """
-    log.info("Start to link words with their affixes")
 
     def get_elements_from_str(set_as_str: str, separator: str = " ") -> list:
         return [element.strip() for element in set_as_str.split(separator)]
 
+    afx_ids_by_name = defaultdict(list)
+    for afx_id, afx_name in Word.query.join(Type).filter(Type.type == "Afx") \
+            .with_entities(Word.id, Word.name).all():
+        afx_ids_by_name[afx_name].append(afx_id)
+
+    primitive_id_by_id_old = {}
+    for id_old, word_id in Word.query.with_entities(Word.id_old, Word.id) \
+            .order_by(Word.id.asc()).all():
+        primitive_id_by_id_old.setdefault(id_old, word_id)
+
     all_links_counter = 0
+    links = {}
 
     for item in words:
         if not item[3]:
@@ -107,40 +127,108 @@ def db_link_affixes(words: List[List[str]]) -> None:
         djifoas_as_str_with_hyphen = [f"{affix}-" for affix in djifoas_as_str]
         djifoas = djifoas_as_str + djifoas_as_str_with_hyphen
 
-        djifoas_as_object = Word.query.join(Type) \
-            .filter(Word.name.in_(djifoas)) \
-            .filter(Type.type == "Afx").all()
+        djifoa_ids = list(dict.fromkeys(
+            afx_id for djifoa in djifoas for afx_id in afx_ids_by_name.get(djifoa, [])))
 
-        all_links_counter += len(djifoas_as_object)
+        all_links_counter += len(djifoa_ids)
 
-        primitive = Word.query.filter(Word.id_old == int(item[0])).first()
-        primitive.add_children(djifoas_as_object)
-        log.debug("%s < %s", primitive.name, djifoas_as_str)
+        primitive_id = primitive_id_by_id_old.get(int(item[0]))
+        if primitive_id is None:
+            log.warning("There is no word with id_old %s for affixes %s", item[0], djifoas_as_str)
+            continue
+        links.update(dict.fromkeys((primitive_id, afx_id) for afx_id in djifoa_ids))
+        log.debug("%s < %s", item[0], djifoas_as_str)
+    return links, all_links_counter
 
-    db.session.commit()
+
+def get_key_links() -> dict:
+    """
+    Collect relations between definitions and keys from their bodies
+    :return: dict with (KID, DID) tuples as keys in order of appearance
+    """
+    key_id_by_word = {
+        (word, language): key_id for key_id, word, language in
+        Key.query.with_entities(Key.id, Key.word, Key.language).all()}
+
+    links = {}
+    for definition_id, body, language in Definition.query.with_entities(
+            Definition.id, Definition.body, Definition.language).all():
+        key_ids = [key_id_by_word[(key, language)] for key in keys_from_string(body)
+                   if (key, language) in key_id_by_word]
+        links.update(dict.fromkeys((key_id, definition_id) for key_id in key_ids))
+    return links
+
+
+@instrumented()
+def db_link_authors(words: List[List[str]]) -> int:
+    """
+    Create relations between words and their authors (WID <-> AID) in DB
+    These connections locate in 't_connect_authors' table
+
+    :param words: List of words' data received from a text file
+        using function convert_file_to_list
+    :return: Number of created links
+    """
+    log.info("Start to link words with their authors")
+    total = db_insert_links(t_connect_authors, ("AID", "WID"), get_author_links(words))
+    log.info("Total number of links Word < Author: %s", total)
+    log.info("Finish to link words with their authors")
+    return total
+
+
+@instrumented()
+def db_link_complexes(words: List[List[str]]) -> int:
+    """
+    Create relations in DB between -
+        primitives and derivative complexes,
+        primitives and derivative small words,
+        small words and combinations based on them
+    :param words: List of words' data received from a text file
+        using function convert_file_to_list
+    :return: Number of created links
+    """
+    log.info("Start to create relations between primitives and their derivatives")
+    total = db_insert_links(t_connect_words, ("parent_id", "child_id"), get_complex_links(words))
+    log.info("Total number of links Word < Word: %s", total)
+    log.info("Finish to create relations between primitives and their derivatives")
+    return total
+
+
+@instrumented()
+def db_link_affixes(words: List[List[str]]) -> int:
+    """
+    Create relations in DB between primitives and their affixes
+    :param words: List of words' data received from a text file
+        using function convert_file_to_list
+    :return: Number of created links
+    """
+    log.info("Start to link words with their affixes")
+
+    links, all_links_counter = get_affix_links(words)
+    existing_links = set(db.session.query(
+        t_connect_words.c.parent_id, t_connect_words.c.child_id).all())
+    total = db_insert_links(t_connect_words, ("parent_id", "child_id"), (
+        link for link in links if link not in existing_links))
 
     log.info("Total number of links Word < Afx: %s", all_links_counter)
     log.info("Finish to link words with their affixes")
+    return total
 
 
-def db_link_keys() -> None:
+@instrumented()
+def db_link_keys() -> int:
     """
     # Create relations in DB between definitions and their keys
-    :return: None
+    :return: Number of created links
     """
     log.info("Start to link definitions with their keys")
-
-    for definition in Definition.query.all():
-        added_keys = definition.link_keys()
-        log.debug(
-            "%s - %s: %s", definition.source_word.name,
-            definition.position, [k.word for k in added_keys] if added_keys else None)
-
-    db.session.commit()
+    total = db_insert_links(t_connect_keys, ("KID", "DID"), get_key_links())
+    log.info("Total number of links Definition < Key: %s", total)
     log.info("Finish to link definitions with their keys")
+    return total
 
 
-def db_link_tables(dataset: dict) -> None:
+def db_link_tables(dataset: dict, checkpoint: Optional[ImportCheckpoint] = None) -> None:
     """
     Link existing data between tables. For example,
         connect Word objects with Author object(s)
@@ -150,14 +238,29 @@ def db_link_tables(dataset: dict) -> None:
     These links locate in according tables, like
         connect_authors, connect_words, connect_keys
     See Models module for more details about them
+    Each kind of links is committed separately
+    :param dataset:
+    :param checkpoint: ImportCheckpoint, links are recorded in it
+        with their data and skipped if they are already recorded
     :return: None
     """
     words_dataset = dataset[Word.__name__][0]
+    link_steps = (
+        (db_link_authors, (words_dataset, )),
+        (db_link_complexes, (words_dataset, )),
+        (db_link_affixes, (words_dataset, )),
+        (db_link_keys, ()), )
+
     log.info("Start to link tables data")
-    db_link_authors(words_dataset)
-    db_link_complexes(words_dataset)
-    db_link_affixes(words_dataset)
-    db_link_keys()
+    for link, arguments in link_steps:
+        stage_name = f"link:{link.__name__}"
+        if checkpoint and checkpoint.is_done(stage_name):
+            log.info("Stage '%s' is already completed, skipped", stage_name)
+            continue
+        total = link(*arguments)
+        if checkpoint:
+            checkpoint.record(stage_name, total)
+        db.session.commit()
     log.info("Finish to link tables data")
 
 
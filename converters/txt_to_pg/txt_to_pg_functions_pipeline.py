@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Module for pipelined filling of the database from text files
+
+Parsing, conversion and DB writes are three overlapped stages
+connected with bounded queues:
+    parser thread -> parsed files -> converters -> table rows -> writer threads
+While writers load one table, the next table is converted and the next file is parsed.
+Independent tables (like Author, Event, Setting, Syllable) are written in parallel,
+dependent ones wait until their dependencies are committed (see table_dependencies)
+"""
+
+import queue
+import threading
+from typing import Iterable, Optional
+
+from loglan_db import db
+
+from config import log
+from config.metrics import metrics
+from config.postgres.models import Event, Type, Definition, Word, all_models_pg
+from config.text.cache import DatasetCache, get_dataset_cache
+from config.text.functions import load_dictionary_file, prefetch_files
+from converters.loaders import TableRows, get_loader, rows_from_objects
+from converters.txt_to_pg.converters_txt_to_pg import converters_pg
+from converters.txt_to_pg.txt_to_pg_functions_fill import \
+    converter_inputs, get_converter_arguments
+
+# Tables which have to be written before the table is converted,
+# because its converter queries them or its foreign keys refer to them
+table_dependencies = {
+    Word.__name__: (Event.__name__, Type.__name__),
+    Definition.__name__: (Word.__name__,), }
+
+_DONE = None
+
+
+class ImportPipeline:
+    """
+    Overlapped txt -> db import of all tables
+    Each stage checks the common stop flag, so an error in any
+    of them stops the whole pipeline and is re-raised by run()
+    """
+    poll_interval = 0.1
+
+    def __init__(self, source_path: str, language: str, writers: int = 4,
+                 queue_size: int = 2, cache: Optional[DatasetCache] = None):
+        """
+        :param source_path: Directory or URL prefix with text files
+        :param language: Dictionary language
+        :param writers: Number of parallel writer threads (only one for SQLite)
+        :param queue_size: Maximum number of items waiting between stages
+        :param cache: DatasetCache for parsed files, the default one is used if None
+        """
+        self.source_path = source_path
+        self.language = language
+        self.writers = writers
+        self.cache = cache if cache else get_dataset_cache()
+        self.models = {model.__name__: model for model in all_models_pg}
+
+        self.parsed = queue.Queue(maxsize=queue_size)
+        self.converted = queue.Queue(maxsize=queue_size)
+        self.written = {model_name: threading.Event() for model_name in converter_inputs}
+        self.stop = threading.Event()
+        self.errors = []
+        self.txt_dataset = {}
+
+    def fail(self, error: Exception) -> None:
+        """
+        Remember the error and stop all stages
+        :param error:
+        :return: None
+        """
+        log.error("Import pipeline stopped: %s", error)
+        self.errors.append(error)
+        self.stop.set()
+
+    def put(self, channel: queue.Queue, item) -> bool:
+        """
+        Put item to the bounded queue, waiting for a free slot
+        :param channel:
+        :param item:
+        :return: False if the pipeline was stopped meanwhile
+        """
+        while not self.stop.is_set():
+            try:
+                channel.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, channel: queue.Queue):
+        """
+        Get item from the queue, waiting for it
+        :param channel:
+        :return: item or _DONE if the pipeline was stopped meanwhile
+        """
+        while not self.stop.is_set():
+            try:
+                return channel.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def parse(self) -> None:
+        """
+        Parser stage: read text files in the order converters need them
+        :return: None
+        """
+        file_names = dict.fromkeys(
+            name for names in converter_inputs.values() for name in names)
+        try:
+            prefetch_files(f"{self.source_path}{self.models[model_name].file_name}"
+                           for model_name in file_names)
+            for model_name in file_names:
+                model = self.models[model_name]
+                with metrics.stage(f"parse:{model_name}") as stage:
+                    rows = load_dictionary_file(
+                        url=f"{self.source_path}{model.file_name}",
+                        model_name=model_name, cache=self.cache)
+                    stage.rows = len(rows)
+                log.debug("'%s' file parsed: %s lines", model_name, len(rows))
+                if not self.put(self.parsed, (model_name, rows)):
+                    return
+        except Exception as err:  # pylint: disable=W0703
+            self.fail(err)
+
+    def write(self, engine) -> None:
+        """
+        Writer stage: load converted tables, each one in its own transaction
+        :param engine: Engine of the target database
+        :return: None
+        """
+        while True:
+            item = self.get(self.converted)
+            if item is _DONE:
+                return
+            model_name, table_rows = item
+            try:
+                with metrics.stage(f"write:{model_name}") as stage, engine.begin() as connection:
+                    stage.rows = total = get_loader(connection).load(
+                        self.models[model_name].__table__, table_rows.columns, table_rows.rows)
+            except Exception as err:  # pylint: disable=W0703
+                self.fail(err)
+                return
+            log.info("Total number of %s objects - %s", model_name, total)
+            self.written[model_name].set()
+
+    def wait_parsed(self, model_names: Iterable[str]) -> bool:
+        """
+        Take parsed files from the parser until all required ones are received
+        :param model_names:
+        :return: False if the pipeline was stopped meanwhile
+        """
+        while any(name not in self.txt_dataset for name in model_names):
+            item = self.get(self.parsed)
+            if item is _DONE:
+                return False
+            model_name, rows = item
+            self.txt_dataset[model_name] = rows
+        return True
+
+    def wait_written(self, model_names: Iterable[str]) -> bool:
+        """
+        Wait until the tables are committed by writers
+        :param model_names:
+        :return: False if the pipeline was stopped meanwhile
+        """
+        for model_name in model_names:
+            while not self.written[model_name].wait(self.poll_interval):
+                if self.stop.is_set():
+                    return False
+        return not self.stop.is_set()
+
+    def convert(self, converters: tuple) -> None:
+        """
+        Converter stage: build table rows in dependency order
+        Runs in the calling thread, because converters use the app's session
+        :param converters:
+        :return: None
+        """
+        for converter, model_name in zip(converters, converter_inputs):
+            if not self.wait_parsed(converter_inputs[model_name]) \
+                    or not self.wait_written(table_dependencies.get(model_name, ())):
+                return
+            log.info("Start to process %s objects", model_name)
+            objects = converter(*get_converter_arguments(
+                model_name, self.txt_dataset, self.language))
+            # Finish the read transaction of the converter's queries
+            db.session.commit()
+            table_rows = objects if isinstance(objects, TableRows) else rows_from_objects(objects)
+            log.info("Add %s objects to Database", model_name)
+            if not self.put(self.converted, (model_name, table_rows)):
+                return
+
+    def run(self, converters: tuple = converters_pg) -> dict:
+        """
+        Run all stages and wait for them
+        :param converters:
+        :return: Dataset for converters, as get_dataset_for_converters returns
+        """
+        engine = db.engine
+        writers = 1 if engine.dialect.name == "sqlite" else max(self.writers, 1)
+        threads = [threading.Thread(target=self.parse, name="txt-parser", daemon=True)] + [
+            threading.Thread(target=self.write, args=(engine,), name=f"db-writer-{number}", daemon=True)
+            for number in range(writers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.convert(converters)
+            for _ in range(writers):
+                self.put(self.converted, _DONE)
+        except Exception as err:  # pylint: disable=W0703
+            db.session.rollback()
+            self.fail(err)
+
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+        return {model_name: get_converter_arguments(model_name, self.txt_dataset, self.language)
+                for model_name in converter_inputs}
+
+
+def db_fill_tables_pipelined(source_path: str, language: str, writers: int = 4,
+                             cache: Optional[DatasetCache] = None) -> dict:
+    """
+    Parse text files and fill tables with overlapped stages
+    ! The order Type -> Word -> Definition is still respected,
+    see table_dependencies
+    :param source_path:
+    :param language:
+    :param writers: Number of parallel writer threads
+    :param cache: DatasetCache for parsed files, the default one is used if None
+    :return: Dataset for converters, needed for linking tables
+    """
+    log.info("Start to fill tables with dictionary data")
+    dataset = ImportPipeline(
+        source_path=source_path, language=language, writers=writers, cache=cache).run()
+    log.info("Finish to fill tables with dictionary data\n")
+    return dataset
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Module for creating tables with deferred indexes and constraints
+
+Indexes, unique and foreign key constraints slow down every insert of a bulk load,
+so tables are created without them and they are built (and so validated)
+in one pass, after all data is loaded and linked.
+SQLite has no ALTER TABLE ADD CONSTRAINT, so there unique constraints
+are built as unique indexes and foreign keys stay in tables
+(SQLite does not check them by default anyway).
+PostgreSQL tables may also be created UNLOGGED for the load
+and switched to LOGGED before the constraints are built
+"""
+
+from typing import Iterable, List, Sequence, Tuple
+
+from loglan_db import db
+from sqlalchemy import DDL, ForeignKeyConstraint, Index, MetaData, UniqueConstraint
+from sqlalchemy.schema import AddConstraint, CreateIndex, DDLElement
+
+from config import log
+from config.metrics import metrics
+
+# (name, DDL element) to execute after loading
+DeferredDDL = Tuple[str, DDLElement]
+
+
+def deferred_name(table_name: str, columns: Sequence[str], suffix: str) -> str:
+    """
+    Name for an index or a constraint without its own name,
+    the same as PostgreSQL gives, like 'words_type_fkey'
+    :param table_name:
+    :param columns:
+    :param suffix: 'key' for unique constraints, 'fkey' for foreign keys, 'idx' for indexes
+    :return:
+    """
+    return f"{table_name}_{'_'.join(columns)}_{suffix}"
+
+
+def split_deferred(metadata: MetaData, dialect_name: str,
+                   extra_indexes: Iterable[Tuple[str, Sequence[str]]] = ()
+                   ) -> Tuple[MetaData, List[DeferredDDL]]:
+    """
+    Copy tables without indexes, unique and foreign key constraints
+    :param metadata: Metadata of all models
+    :param dialect_name: Name of the target database dialect
+    :param extra_indexes: Additional (table name, columns) indexes
+    :return: Metadata copy for creating tables and DDL elements to execute after loading
+    """
+    # New indexes and constraints attach themselves to their table,
+    # so they are built on another copy, which is never created
+    bare_metadata, deferred_metadata = MetaData(), MetaData()
+    for table in metadata.sorted_tables:
+        table.to_metadata(deferred_metadata)
+
+    deferred, foreign_keys = [], []
+    for table in metadata.sorted_tables:
+        bare_table = table.to_metadata(bare_metadata)
+        target = deferred_metadata.tables[table.name]
+        for constraint in list(bare_table.constraints):
+            if isinstance(constraint, UniqueConstraint):
+                bare_table.constraints.remove(constraint)
+                columns = [column.name for column in constraint.columns]
+                name = constraint.name or deferred_name(table.name, columns, "key")
+                if dialect_name == "sqlite":
+                    deferred.append((name, CreateIndex(Index(
+                        name, *(target.c[column] for column in columns), unique=True))))
+                else:
+                    deferred.append((name, AddConstraint(UniqueConstraint(
+                        *(target.c[column] for column in columns), name=name))))
+            elif isinstance(constraint, ForeignKeyConstraint) and dialect_name != "sqlite":
+                bare_table.constraints.remove(constraint)
+                for column in constraint.columns:
+                    column.foreign_keys.clear()
+                name = constraint.name or deferred_name(
+                    table.name, [column.name for column in constraint.columns], "fkey")
+                referred = deferred_metadata.tables[constraint.referred_table.name]
+                foreign_keys.append((name, AddConstraint(ForeignKeyConstraint(
+                    [target.c[column.name] for column in constraint.columns],
+                    [referred.c[element.column.name] for element in constraint.elements],
+                    name=name, ondelete=constraint.ondelete, onupdate=constraint.onupdate))))
+        for index in list(bare_table.indexes):
+            bare_table.indexes.remove(index)
+        deferred.extend((index.name, CreateIndex(index)) for index in table.indexes)
+
+    for table_name, columns in extra_indexes:
+        target = deferred_metadata.tables[table_name]
+        name = deferred_name(table_name, columns, "idx")
+        deferred.append((name, CreateIndex(Index(name, *(target.c[column] for column in columns)))))
+    # Unique constraints first, as foreign keys may refer to them
+    return bare_metadata, deferred + foreign_keys
+
+
+def db_deferred_ddl(extra_indexes: Iterable[Tuple[str, Sequence[str]]] = (),
+                    unlogged: bool = False, create: bool = False) -> List[DeferredDDL]:
+    """
+    DDL elements deferred until the end of the load
+    :param extra_indexes: Additional (table name, columns) indexes
+    :param unlogged: PostgreSQL tables are UNLOGGED and have to be switched to LOGGED
+    :param create: Also create the tables (see db_create_tables_deferred)
+    :return: DDL elements for db_create_deferred
+    """
+    dialect_name = db.engine.dialect.name
+    bare_metadata, deferred = split_deferred(db.metadata, dialect_name, extra_indexes)
+    if create:
+        bare_metadata.create_all(db.engine)
+
+    if unlogged and dialect_name == "postgresql":
+        if create:
+            with db.engine.begin() as connection:
+                for table in bare_metadata.sorted_tables:
+                    connection.execute(DDL("ALTER TABLE %(fullname)s SET UNLOGGED").against(table))
+            log.info("Tables created as UNLOGGED")
+        deferred = [(f"logged:{table.name}", DDL(
+            "ALTER TABLE %(fullname)s SET LOGGED").against(table))
+                    for table in bare_metadata.sorted_tables] + deferred
+    elif unlogged and create:
+        log.warning("UNLOGGED tables are not supported by %s", dialect_name)
+    return deferred
+
+
+def db_create_tables_deferred(extra_indexes: Iterable[Tuple[str, Sequence[str]]] = (),
+                              unlogged: bool = False) -> List[DeferredDDL]:
+    """
+    Create all tables without indexes and constraints (except primary keys)
+    :param extra_indexes: Additional (table name, columns) indexes
+    :param unlogged: Create PostgreSQL tables as UNLOGGED, they are
+        switched to LOGGED by db_create_deferred
+    :return: DDL elements for db_create_deferred
+    """
+    deferred = db_deferred_ddl(extra_indexes, unlogged=unlogged, create=True)
+    log.info("Tables created, %s indexes and constraints deferred", len(deferred))
+    return deferred
+
+
+def db_create_tables(deferred: bool = True, unlogged: bool = False) -> List[DeferredDDL]:
+    """
+    Create all tables for a full import
+    :param deferred: Build indexes and constraints after loading, see db_create_deferred
+    :param unlogged: Create PostgreSQL tables as UNLOGGED for the load (only if deferred)
+    :return: DDL elements for db_create_deferred, empty if nothing is deferred
+    """
+    if not deferred:
+        db.create_all()
+        return []
+    return db_create_tables_deferred(unlogged=unlogged)
+
+
+def db_create_deferred(deferred: Iterable[DeferredDDL], connection=None) -> int:
+    """
+    Build deferred indexes and constraints in one transaction
+    Data is validated by the database while constraints are added
+    :param deferred: DDL elements returned by db_create_tables_deferred
+    :param connection: Connection with an open transaction, a new transaction if None
+    :return: Number of executed DDL elements
+    """
+    if connection is None:
+        with db.engine.begin() as connection:
+            return db_create_deferred(deferred, connection)
+
+    total = 0
+    for name, element in deferred:
+        with metrics.stage(name):
+            connection.execute(element)
+        total += 1
+    log.info("%s deferred indexes and constraints built", total)
+    return total
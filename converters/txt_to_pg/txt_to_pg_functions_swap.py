@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Module for the staged (blue/green) import into PostgreSQL
+
+The new dictionary is built in a staging schema of the same database
+(all connections get it as their search_path), so the live schema
+stays complete for readers during the whole import.
+After the checks pass, the schemas are swapped by renaming in one transaction:
+    live -> previous, staging -> live
+Privileges of the live schema and its tables are copied to the staging one
+before the swap, so readers keep their access to the new dictionary.
+The previous schema is kept until the next swap, so db_rollback_swap
+can bring it back instantly.
+Only schemas created by this module (marked with SCHEMA_MARKER comment)
+are ever dropped
+"""
+
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple
+
+from loglan_db import db
+from sqlalchemy import MetaData, event, func, inspect, select, text
+
+from config import log
+from config.postgres import LIVE_SCHEMA, PREVIOUS_SCHEMA, READER_ROLES, \
+    STAGING_MIN_ROWS_RATIO, STAGING_SCHEMA
+from config.postgres.models import all_models_pg, \
+    t_connect_authors, t_connect_keys, t_connect_words
+
+# Comment of the schemas created by the staged import
+SCHEMA_MARKER = "Loglan dictionary of the staged import"
+
+# Relation kinds of pg_class with copied privileges
+PRIVILEGE_OBJECTS = {"r": "TABLE", "p": "TABLE", "S": "SEQUENCE"}
+
+
+class StagingCheckError(Exception):
+    """The staging schema does not pass the checks and is not swapped"""
+
+
+def quote_schema(schema: str) -> str:
+    return db.engine.dialect.identifier_preparer.quote_schema(schema)
+
+
+def db_schema_exists(connection, schema: str) -> bool:
+    return schema in inspect(connection).get_schema_names()
+
+
+def db_schema_is_staged(connection, schema: str) -> bool:
+    """
+    :param connection:
+    :param schema:
+    :return: True if the schema was created by the staged import
+    """
+    comment = connection.execute(text(
+        "SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace "
+        "WHERE nspname = :schema"), {"schema": schema}).scalar()
+    return comment == SCHEMA_MARKER
+
+
+def db_drop_staged_schema(connection, schema: str) -> None:
+    """
+    Drop the schema with all its data, only if it was created by the staged import
+    :param connection:
+    :param schema:
+    :return: None
+    """
+    if not db_schema_exists(connection, schema):
+        return
+    if not db_schema_is_staged(connection, schema):
+        raise StagingCheckError(
+            f"Schema '{schema}' was not created by the staged import and is not dropped, "
+            f"drop or rename it manually")
+    connection.exec_driver_sql(f"DROP SCHEMA {quote_schema(schema)} CASCADE")
+
+
+def db_prepare_staging(schema: str = STAGING_SCHEMA, keep: bool = False,
+                       previous: str = PREVIOUS_SCHEMA) -> None:
+    """
+    Create an empty staging schema
+    The previous schema is checked before the import too,
+    the swap after it would fail, if the previous schema could not be dropped
+    :param schema:
+    :param keep: Keep the existing schema with its data, for a resumed import
+    :param previous:
+    :return: None
+    """
+    with db.engine.begin() as connection:
+        if db_schema_exists(connection, previous) and not db_schema_is_staged(connection, previous):
+            raise StagingCheckError(
+                f"Schema '{previous}' was not created by the staged import and would not be "
+                f"replaced by the swap, drop it manually after checking its content: "
+                f"DROP SCHEMA {quote_schema(previous)} CASCADE")
+        if not keep:
+            db_drop_staged_schema(connection, schema)
+        elif db_schema_exists(connection, schema) and not db_schema_is_staged(connection, schema):
+            raise StagingCheckError(
+                f"Schema '{schema}' was not created by the staged import and is not resumed")
+        connection.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {quote_schema(schema)}")
+        connection.execute(text(
+            f"COMMENT ON SCHEMA {quote_schema(schema)} IS :marker"), {"marker": SCHEMA_MARKER})
+    log.info("Schema '%s' is prepared for the import", schema)
+
+
+@contextmanager
+def schema_search_path(schema: str = STAGING_SCHEMA):
+    """
+    Direct all unqualified names of the application's connections to the schema
+    Existing pooled connections are closed, so every connection of the block is a new one
+    :param schema:
+    :return:
+    """
+    engine = db.engine
+    statement = f"SET search_path TO {quote_schema(schema)}"
+
+    def set_search_path(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+        # Not to be reverted by the pool's rollback
+        dbapi_connection.commit()
+
+    db.session.remove()
+    engine.dispose()
+    event.listen(engine, "connect", set_search_path)
+    try:
+        yield
+    finally:
+        db.session.remove()
+        event.remove(engine, "connect", set_search_path)
+        engine.dispose()
+
+
+def schema_tables(schema: str, models: Iterable = all_models_pg) -> dict:
+    """
+    :param schema:
+    :param models:
+    :return: Tables of loaded models and connecting tables
+        qualified with the schema by their names
+    """
+    metadata = MetaData()
+    tables = [model.__table__ for model in models if model.__load_to_db__] + [
+        t_connect_authors, t_connect_words, t_connect_keys]
+    return {table.name: table.to_metadata(metadata, schema=schema) for table in tables}
+
+
+def db_check_staging(staging: str = STAGING_SCHEMA, live: str = LIVE_SCHEMA,
+                     min_rows_ratio: float = STAGING_MIN_ROWS_RATIO) -> List[str]:
+    """
+    Compare row counts of the staging tables with the live ones
+    Constraints are already validated by the database, when they were built
+    :param staging:
+    :param live:
+    :param min_rows_ratio: Minimal allowed ratio of staging rows to live rows
+    :return: List of found problems, empty if the staging schema can be swapped
+    """
+    problems = []
+    with db.engine.begin() as connection:
+        live_table_names = set(inspect(connection).get_table_names(schema=live))
+        live_tables = schema_tables(live)
+        for name, table in schema_tables(staging).items():
+            # Statistics for the planner are ready before readers come
+            connection.exec_driver_sql(
+                f"ANALYZE {connection.dialect.identifier_preparer.format_table(table)}")
+            rows = connection.execute(select(func.count()).select_from(table)).scalar()
+            live_rows = connection.execute(select(func.count()).select_from(
+                live_tables[name])).scalar() if name in live_table_names else 0
+            log.info("%s: %s rows (%s live)", name, rows, live_rows)
+            if not rows:
+                problems.append(f"Table '{name}' is empty")
+            elif rows < live_rows * min_rows_ratio:
+                problems.append(f"Table '{name}' has {rows} rows, {live_rows} in the live schema")
+    for problem in problems:
+        log.warning(problem)
+    return problems
+
+
+def db_schema_privileges(connection, schema: str) -> List[Tuple[str, str, bool]]:
+    """
+    Privileges granted on the schema to other roles than its owner
+    :param connection:
+    :param schema:
+    :return: List of (grantee, privilege, grantable), grantee is PUBLIC for everyone
+    """
+    return [tuple(row) for row in connection.execute(text(
+        "SELECT CASE WHEN acl.grantee = 0 THEN 'PUBLIC' "
+        "ELSE pg_get_userbyid(acl.grantee) END, acl.privilege_type, acl.is_grantable "
+        "FROM pg_namespace AS n, aclexplode(n.nspacl) AS acl "
+        "WHERE n.nspname = :schema AND acl.grantee <> n.nspowner"), {"schema": schema})]
+
+
+def db_table_privileges(connection, schema: str) -> List[Tuple[str, str, str, str, bool]]:
+    """
+    Privileges granted on the schema's tables and sequences to other roles than their owners
+    :param connection:
+    :param schema:
+    :return: List of (name, kind, grantee, privilege, grantable)
+    """
+    return [tuple(row) for row in connection.execute(text(
+        "SELECT c.relname, c.relkind, CASE WHEN acl.grantee = 0 THEN 'PUBLIC' "
+        "ELSE pg_get_userbyid(acl.grantee) END, acl.privilege_type, acl.is_grantable "
+        "FROM pg_class AS c JOIN pg_namespace AS n ON n.oid = c.relnamespace, "
+        "aclexplode(c.relacl) AS acl "
+        "WHERE n.nspname = :schema AND c.relkind IN ('r', 'p', 'S') "
+        "AND acl.grantee <> c.relowner"), {"schema": schema})]
+
+
+def grant_statement(connection, privilege: str, target: str,
+                    grantee: str, grantable: bool) -> str:
+    """
+    :param connection:
+    :param privilege:
+    :param target: Quoted object with its kind, like SCHEMA "lod"
+    :param grantee: Role name or PUBLIC
+    :param grantable:
+    :return: GRANT statement
+    """
+    role = grantee if grantee == "PUBLIC" else connection.dialect.identifier_preparer.quote(grantee)
+    option = " WITH GRANT OPTION" if grantable else ""
+    return f"GRANT {privilege} ON {target} TO {role}{option}"
+
+
+def db_check_readers(live: str = LIVE_SCHEMA, roles: Iterable[str] = READER_ROLES) -> None:
+    """
+    Make sure that readers of the live schema can be given access to the new one
+    :param live:
+    :param roles:
+    :return: None
+    """
+    with db.engine.connect() as connection:
+        if list(roles) or db_schema_privileges(connection, live):
+            return
+    raise StagingCheckError(
+        f"No reader would have access to the new schema: the live schema '{live}' "
+        f"has no granted privileges and READER_ROLES are not set")
+
+
+def db_copy_privileges(connection, source: str, target: str) -> None:
+    """
+    Grant the privileges of the source schema and its tables on the target ones
+    Tables, which do not exist in the target schema, are skipped
+    :param connection:
+    :param source:
+    :param target:
+    :return: None
+    """
+    for grantee, privilege, grantable in db_schema_privileges(connection, source):
+        connection.exec_driver_sql(grant_statement(
+            connection, privilege, f"SCHEMA {quote_schema(target)}", grantee, grantable))
+
+    preparer = connection.dialect.identifier_preparer
+    target_names = set(inspect(connection).get_table_names(schema=target)) | set(
+        inspect(connection).get_sequence_names(schema=target))
+    for name, kind, grantee, privilege, grantable in db_table_privileges(connection, source):
+        if name not in target_names:
+            continue
+        qualified = f"{quote_schema(target)}.{preparer.quote(name)}"
+        connection.exec_driver_sql(grant_statement(
+            connection, privilege, f"{PRIVILEGE_OBJECTS[kind]} {qualified}", grantee, grantable))
+
+
+def db_grant_readers(connection, schema: str, roles: Iterable[str] = READER_ROLES) -> None:
+    """
+    Give read-only roles access to the new schema
+    :param connection:
+    :param schema:
+    :param roles:
+    :return: None
+    """
+    preparer = connection.dialect.identifier_preparer
+    for role in roles:
+        connection.exec_driver_sql(
+            f"GRANT USAGE ON SCHEMA {quote_schema(schema)} TO {preparer.quote(role)}")
+        connection.exec_driver_sql(
+            f"GRANT SELECT ON ALL TABLES IN SCHEMA {quote_schema(schema)} TO {preparer.quote(role)}")
+
+
+def db_swap_schemas(staging: str = STAGING_SCHEMA, live: str = LIVE_SCHEMA,
+                    previous: str = PREVIOUS_SCHEMA) -> None:
+    """
+    Make the staging schema live in one transaction,
+    the live one becomes the previous one (the older previous one is dropped)
+    Readers see either the old or the new dictionary, never a partial one
+    and keep the same privileges on it
+    :param staging:
+    :param live:
+    :param previous:
+    :return: None
+    """
+    with db.engine.begin() as connection:
+        db_copy_privileges(connection, live, staging)
+        db_grant_readers(connection, staging)
+        db_drop_staged_schema(connection, previous)
+        if db_schema_exists(connection, live):
+            connection.exec_driver_sql(
+                f"ALTER SCHEMA {quote_schema(live)} RENAME TO {quote_schema(previous)}")
+        connection.exec_driver_sql(
+            f"ALTER SCHEMA {quote_schema(staging)} RENAME TO {quote_schema(live)}")
+    log.info("Schema '%s' is live now, the previous one is kept as '%s'", staging, previous)
+
+
+def db_rollback_swap(staging: str = STAGING_SCHEMA, live: str = LIVE_SCHEMA,
+                     previous: str = PREVIOUS_SCHEMA) -> None:
+    """
+    Bring the previous schema back in one transaction,
+    the rolled back live one is kept as the staging one
+    :param staging:
+    :param live:
+    :param previous:
+    :return: None
+    """
+    with db.engine.begin() as connection:
+        if not db_schema_exists(connection, previous):
+            raise StagingCheckError(f"There is no previous schema '{previous}' to roll back to")
+        db_drop_staged_schema(connection, staging)
+        connection.exec_driver_sql(
+            f"ALTER SCHEMA {quote_schema(live)} RENAME TO {quote_schema(staging)}")
+        connection.exec_driver_sql(
+            f"ALTER SCHEMA {quote_schema(previous)} RENAME TO {quote_schema(live)}")
+    log.info("Schema '%s' is live again", previous)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Module for incremental synchronization of the database with text files
+
+Instead of recreating all tables, the incoming dataset is compared
+with the existing data by each model's __sync_keys__ and only
+the difference (inserts, updates and deletes) is applied,
+including the connecting tables. Everything runs in one transaction
+"""
+
+from datetime import date, datetime
+from typing import List
+
+from sqlalchemy import bindparam, select, tuple_
+
+from loglan_db import db
+
+from config import log
+from config.metrics import metrics
+from config.postgres.models import Word, all_models_pg, \
+    t_connect_authors, t_connect_keys, t_connect_words
+from converters.loaders import TableRows, chunks, get_loader, rows_from_objects
+from converters.txt_to_pg.converters_txt_to_pg import converters_pg
+from converters.txt_to_pg.txt_to_pg_functions_link import \
+    get_affix_links, get_author_links, get_complex_links, get_key_links
+
+
+def is_same_value(new_value, old_value) -> bool:
+    """
+    Compare a converted value with the value stored in DB
+    Converters produce datetime objects for Date columns,
+    so they are compared by date only
+    :param new_value:
+    :param old_value:
+    :return: bool
+    """
+    if isinstance(new_value, datetime) and isinstance(old_value, date) \
+            and not isinstance(old_value, datetime):
+        return new_value.date() == old_value
+    return new_value == old_value
+
+
+def db_sync_table(model, table_rows: TableRows) -> None:
+    """
+    Insert new, update changed and delete missing rows of the model's table
+    :param model: Model class with __sync_keys__
+    :param table_rows: Rows from the incoming dataset
+    :return: None
+    """
+    table = model.__table__
+    columns = tuple(table_rows.columns)
+    key_columns = model.__sync_keys__
+    key_indexes = [columns.index(column) for column in key_columns]
+    value_columns = [column for column in columns if column not in ("id", ) + key_columns]
+
+    incoming = {}
+    for row in table_rows.rows:
+        incoming[tuple(row[index] for index in key_indexes)] = row
+
+    existing = {}
+    for row in db.session.execute(select(
+            [table.c.id] + [table.c[column] for column in key_columns + tuple(value_columns)])):
+        existing[tuple(row[1:len(key_columns) + 1])] = (row[0], row[len(key_columns) + 1:])
+
+    new_rows, changed_rows = [], []
+    for key, row in incoming.items():
+        if key not in existing:
+            new_rows.append(row)
+            continue
+        row_id, old_values = existing[key]
+        new_values = [row[columns.index(column)] for column in value_columns]
+        if not all(is_same_value(new, old) for new, old in zip(new_values, old_values)):
+            changed_rows.append(dict(zip(value_columns, new_values), b_id=row_id))
+
+    stale_ids = [existing[key][0] for key in existing.keys() - incoming.keys()]
+
+    # Stale rows go first, so dependent converters do not see them
+    db_delete_rows(table, stale_ids)
+    if new_rows:
+        get_loader(db.session.connection()).load(table, columns, new_rows)
+    if changed_rows:
+        db.session.execute(
+            table.update().where(table.c.id == bindparam("b_id")).values(
+                {column: bindparam(column) for column in value_columns}),
+            changed_rows)
+
+    log.info("%s: %s inserted, %s updated, %s deleted",
+             model.__name__, len(new_rows), len(changed_rows), len(stale_ids))
+
+
+def db_delete_rows(table, ids: List[int], batch_size: int = 1000) -> int:
+    """
+    Delete rows by ids together with all rows referencing them,
+    like definitions of deleted words or links of deleted definitions
+    :param table: sqlalchemy.Table with 'id' column
+    :param ids: List of ids to delete
+    :param batch_size: Max number of ids in one statement
+    :return: Number of deleted rows of the table
+    """
+    if not ids:
+        return 0
+
+    for dependent in table.metadata.tables.values():
+        for column in dependent.columns:
+            if not any(fk.column is table.c.id for fk in column.foreign_keys):
+                continue
+            for batch in chunks(ids, batch_size):
+                if "id" in dependent.columns:
+                    dependent_ids = [row[0] for row in db.session.execute(
+                        select([dependent.c.id]).where(column.in_(batch)))]
+                    db_delete_rows(dependent, dependent_ids, batch_size)
+                else:
+                    db.session.execute(dependent.delete().where(column.in_(batch)))
+
+    for batch in chunks(ids, batch_size):
+        db.session.execute(table.delete().where(table.c.id.in_(batch)))
+    return len(ids)
+
+
+def db_sync_links(words: List[List[str]], batch_size: int = 1000) -> None:
+    """
+    Bring connecting tables in line with the current data
+    :param words: List of words' data received from a text file
+    :param batch_size: Max number of links in one DELETE statement
+    :return: None
+    """
+    incoming_links = {
+        t_connect_authors: get_author_links(words),
+        t_connect_words: {**get_complex_links(words), **get_affix_links(words)[0]},
+        t_connect_keys: get_key_links(), }
+
+    for table, links in incoming_links.items():
+        columns = tuple(column.name for column in table.columns)
+        existing = set(tuple(row) for row in db.session.execute(select(list(table.columns))))
+        stale_links = list(existing - links.keys())
+        new_links = [link for link in links if link not in existing]
+
+        for batch in chunks(stale_links, batch_size):
+            db.session.execute(table.delete().where(tuple_(*table.columns).in_(batch)))
+        get_loader(db.session.connection()).load(table, columns, new_links)
+        log.info("%s: %s links inserted, %s deleted",
+                 table.name, len(new_links), len(stale_links))
+
+
+def db_sync_tables(dataset: dict, converters: tuple = converters_pg) -> None:
+    """
+    Apply only the difference between the dataset and the database
+    The whole synchronization is committed at once or rolled back on error
+    :param dataset:
+    :param converters:
+    :return: None
+    """
+    log.info("Start to synchronize tables with dictionary data")
+    models = {model.__name__: model for model in all_models_pg}
+    try:
+        for converter, model_name, model_data in zip(
+                converters, dataset.keys(), dataset.values()):
+            with metrics.stage(model_name):
+                objects = converter(*model_data)
+                table_rows = objects if isinstance(objects, TableRows) else rows_from_objects(objects)
+                db_sync_table(models[model_name], table_rows)
+
+        with metrics.stage("links"):
+            db_sync_links(dataset[Word.__name__][0])
+    except Exception:
+        log.error("Synchronization failed, all changes are rolled back")
+        db.session.rollback()
+        raise
+
+    log.debug("Commit Database changes")
+    db.session.commit()
+    log.info("Finish to synchronize tables with dictionary data\n")
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Module for generating a portable SQLite dictionary file from txt files
+
+The same converters as for txt -> db are used. The file is built from scratch
+next to the target with durability turned off (see set_bulk_load_pragmas),
+every table is loaded in one transaction, and indexes are built after
+all data is in. The finished file replaces the target only if the build succeeds
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from loglan_db import app_lod, db
+from sqlalchemy import event
+
+from config import log, DEFAULT_LANGUAGE
+from config.metrics import metrics
+from config.postgres.models import all_models_pg
+from config.sqlite import SQLITE_FILE_PATH, lookup_indexes, set_bulk_load_pragmas, sqlite_uri
+from config.text import IMPORT_DIRECTORY_PATH_LOCAL
+from converters import db_get_statistic
+from converters.txt_to_pg.txt_to_pg_functions_link import db_link_tables
+from converters.txt_to_pg.txt_to_pg_functions_pipeline import db_fill_tables_pipelined
+from converters.txt_to_pg.txt_to_pg_functions_schema import \
+    db_create_deferred, db_create_tables_deferred
+
+sqlite_file_suffixes = ("", "-wal", "-shm", "-journal")
+
+
+def remove_sqlite_file(db_path: str) -> None:
+    """
+    Remove the SQLite file with its journal files
+    :param db_path:
+    :return: None
+    """
+    for suffix in sqlite_file_suffixes:
+        if os.path.exists(f"{db_path}{suffix}"):
+            os.remove(f"{db_path}{suffix}")
+
+
+@contextmanager
+def sqlite_context(db_path: str):
+    """
+    Application context for the SQLite file with bulk load pragmas on every connection
+    :param db_path:
+    :return:
+    """
+    class AppConfig:  # pylint: disable=too-few-public-methods
+        SQLALCHEMY_DATABASE_URI = sqlite_uri(db_path)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    app = app_lod(AppConfig)
+    with app.app_context():
+        engine = db.get_engine(app)
+        event.listen(engine, "connect", set_bulk_load_pragmas)
+        try:
+            yield
+        finally:
+            db.session.remove()
+            engine.dispose()
+
+
+def db_finalize_sqlite() -> None:
+    """
+    Collect statistics for the query planner and turn the file
+    into a single self-contained one (no WAL file next to it)
+    :return: None
+    """
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.exec_driver_sql("PRAGMA journal_mode=DELETE")
+
+
+def convert_txt_to_sqlite(db_path: str = SQLITE_FILE_PATH,
+                          source_directory: str = IMPORT_DIRECTORY_PATH_LOCAL,
+                          language: str = DEFAULT_LANGUAGE) -> None:
+    """
+    Build the SQLite dictionary file from text files
+    :param db_path: Path of the result file, it is replaced if exists
+    :param source_directory:
+    :param language:
+    :return: None
+    """
+    log.info("START SQLITE FILE CREATION")
+    start_time = time.monotonic()
+    build_path = f"{db_path}.build"
+    remove_sqlite_file(build_path)
+
+    try:
+        with sqlite_context(build_path), metrics.run("txt_to_sqlite"):
+            log.info("MILESTONE: Create all new tables without indexes")
+            with metrics.stage("create_all"):
+                deferred = db_create_tables_deferred(lookup_indexes)
+
+            log.info("MILESTONE: Parse files and fill tables")
+            with metrics.stage("fill_tables"):
+                dataset = db_fill_tables_pipelined(
+                    source_path=source_directory, language=language, writers=1)
+
+            log.info("MILESTONE: Link data between tables")
+            with metrics.stage("link_tables"):
+                db_link_tables(dataset=dataset)
+
+            log.info("MILESTONE: Build indexes")
+            with metrics.stage("create_indexes"):
+                db_create_deferred(deferred)
+
+            log.info("ELAPSED TIME: %s\n", timedelta(seconds=time.monotonic() - start_time))
+            with metrics.stage("statistic"):
+                db_get_statistic(all_models_pg)
+
+            # The last connection, so journal mode is not switched back to WAL
+            with metrics.stage("finalize"):
+                db.session.remove()
+                db_finalize_sqlite()
+    except BaseException:
+        remove_sqlite_file(build_path)
+        raise
+
+    remove_sqlite_file(db_path)
+    os.replace(build_path, db_path)
+    log.info("FINISH SQLITE FILE CREATION: %s\n", db_path)
+
+
+if __name__ == "__main__":
+    convert_txt_to_sqlite()
@@ -7,6 +7,7 @@ from converters.pg_to_ac import convert_pg_to_ac
 
 from converters.txt_to_pg import convert_txt_to_pg
 from converters.txt_to_ac import convert_txt_to_ac
+from converters.txt_to_sqlite import convert_txt_to_sqlite
 
 # TODO Add functions for C-Prim words for find vernaculars
 # TODO Check affixes for pred(a,i,o,u,e) - did they added?
@@ -37,5 +38,8 @@ if __name__ == "__main__":
             elif SELECTOR == 5:
                 convert_txt_to_ac()
 
+            elif SELECTOR == 7:
+                convert_txt_to_sqlite()
+
             else:
                 convert_txt_to_pg()